@@ -0,0 +1,61 @@
+"""Compare the latency of the remote embedding API with the local embedding model.
+
+    python benchmarks/bench_embeddings.py [--repeat 20] [--concurrency 16]
+
+The remote side uses BACKEND_TYPE and the matching *_EMBEDDING_MODEL from .env.
+"""
+import _common
+
+import time
+import asyncio
+import argparse
+
+from decouple import config
+
+from services.embeddings import LocalEmbeddings
+
+TEXTS = [
+    "The user said their favourite colour is green and they own two cats.",
+    "Remember that the server movie night is on Fridays at 8pm.",
+    "bot3 promised to tell a story about lighthouses next time.",
+    "A user asked about the difference between stoicism and epicureanism.",
+]
+
+async def run(embed, repeat: int, concurrency: int) -> dict:
+    texts = (TEXTS * (repeat // len(TEXTS) + 1))[:repeat]
+    sequential = await _common.time_async(lambda: embed(texts[0]), repeat)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(embed(texts[i % len(texts)]) for i in range(concurrency)))
+    burst = time.perf_counter() - start
+
+    return {
+        "sequential": _common.summarize(sequential),
+        f"burst_of_{concurrency}_ms": round(burst * 1000, 3),
+    }
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--skip-remote", action="store_true")
+    args = parser.parse_args()
+
+    results = {}
+
+    local = LocalEmbeddings()
+    start = time.perf_counter()
+    await local.warmup()
+    results["local_load_s"] = round(time.perf_counter() - start, 2)
+    results["local"] = await run(local.embed, args.repeat, args.concurrency)
+
+    if not args.skip_remote:
+        from services.infer import OpenAI, Ollama
+        backend = OpenAI() if config("BACKEND_TYPE", default="openai") == "openai" else Ollama()
+        await backend.remote_embed("warmup")
+        results["remote"] = await run(backend.remote_embed, args.repeat, args.concurrency)
+
+    _common.report(results)
+
+if __name__ == "__main__":
+    asyncio.run(main())
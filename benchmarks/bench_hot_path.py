@@ -0,0 +1,198 @@
+"""Micro-benchmarks for the pieces of the per-message hot path.
+
+    python benchmarks/bench_hot_path.py [--only history] [--repeat 50]
+    python benchmarks/bench_hot_path.py --save       # store a baseline
+    python benchmarks/bench_hot_path.py --compare    # flag regressions against it
+
+Runs offline in a temporary directory: the SQLite database and the Chroma
+collection are throwaway, and Discord objects are stand-ins with the
+attributes the code reads. --compare exits with status 1 when any case got
+slower than the baseline by more than --threshold (p50).
+"""
+import _common
+
+import os
+import sys
+import json
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Tuple
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baselines" / "hot_path.json"
+
+Case = Tuple[str, Callable[[], Any], bool]
+
+def fake_channel() -> Any:
+    return SimpleNamespace(name="general", mention="<#1>", id=1, guild=SimpleNamespace(id=1))
+
+def fake_message(content: str) -> Any:
+    author = SimpleNamespace(display_name="user", id=42)
+    return SimpleNamespace(
+        id=3,
+        content=content,
+        author=author,
+        channel=fake_channel(),
+        guild=SimpleNamespace(id=1),
+        created_at=datetime.now(),
+        reference=SimpleNamespace(message_id=2, channel_id=1),
+    )
+
+def reasoning_payload(tools: int, reasoning_chars: int) -> str:
+    return json.dumps({
+        "think": "x" * reasoning_chars,
+        "tool_args": [
+            {"tool_type": "send_message", "content": "y" * 1500, "call_another_tool": index < tools - 1}
+            for index in range(tools)
+        ],
+    })
+
+def seed_history(channel_id: int, rows: int) -> None:
+    from services.database import DatabaseService, insert_messages
+
+    start = datetime.now() - timedelta(seconds=rows)
+    batch = []
+    for index in range(rows):
+        content = json.dumps({"message_type": "user_message", "content": f"message number {index} " + "lorem ipsum " * 10})
+        batch.append({
+            "channel_id": channel_id,
+            "role": "user" if index % 2 else "assistant",
+            "content": content,
+            "image_url": None,
+            "message_id": index,
+            "timestamp": start + timedelta(seconds=index),
+            "guild_id": 1,
+            "index_text": DatabaseService.searchable_text(content),
+        })
+        if len(batch) == 1000:
+            insert_messages(batch)
+            batch = []
+    if batch:
+        insert_messages(batch)
+
+async def database_cases(rows: List[int], only: str = "") -> List[Case]:
+    from services.database import get_database_service
+
+    # The rest of the code shares this instance with the default path
+    # (inside the temporary working directory).
+    db = get_database_service()
+    await db.init_db()
+    cases = []
+    for channel_id, count in enumerate(rows, start=100):
+        names = (f"get_channel_history[{count}]", f"get_channel_history[{count},window=50]")
+        # Seeding 100k rows takes longer than the benchmark itself.
+        if not any(only in name for name in names):
+            continue
+        seed_history(channel_id, count)
+        cases.append((names[0], lambda c=channel_id: db.get_channel_history(c), True))
+        cases.append((names[1], lambda c=channel_id: db.get_channel_history(c, limit=50), True))
+    return cases
+
+def tool_cases() -> List[Case]:
+    from utils.tools import get_tool_info
+
+    return [("get_tool_info", lambda: get_tool_info(1, omit_disabled=True), True)]
+
+def memory_cases() -> List[Case]:
+    from utils.get_prompt import get_memory_count
+
+    return [("get_memory_count", get_memory_count, False)]
+
+def prompt_cases() -> List[Case]:
+    from utils.get_prompt import generate_system_prompt
+
+    bot = SimpleNamespace(bot_name="bot3", user=SimpleNamespace(id=1), server_name="bench", persona="A deep thinker named bot3.")
+    return [
+        (f"generate_system_prompt[{mode}]", lambda mode=mode: generate_system_prompt(bot, fake_channel(), mode), True)
+        for mode in ("fast", "deep")
+    ]
+
+def message_json_cases() -> List[Case]:
+    from cogs.ai_chat import AI
+    from utils.message_cache import CachedMessage
+
+    cog = SimpleNamespace()
+    reference = CachedMessage(id=2, author_id=43, content="a" * 200)
+    return [
+        ("create_message_json", lambda: AI.create_message_json(cog, fake_message("hello " * 300), reference), False),
+    ]
+
+def validation_cases() -> List[Case]:
+    from utils.models import ReasoningModel, get_reasoning_model
+
+    cases = []
+    for tools, chars in ((1, 1000), (10, 40000), (50, 100000)):
+        payload = reasoning_payload(tools, chars)
+        cases.append((f"ReasoningModel.validate[{tools}x{chars}]", lambda p=payload: ReasoningModel.model_validate_json(p), False))
+    deep = get_reasoning_model("deep")
+    payload = reasoning_payload(10, 40000)
+    cases.append(("ReasoningModelDeep.validate[10x40000]", lambda: deep.model_validate_json(payload), False))
+    return cases
+
+async def collect_cases(rows: List[int], only: str = "") -> List[Case]:
+    cases = []
+    # The other groups are cheap to build; the database one only seeds the
+    # tables whose cases pass --only.
+    groups: List[Tuple[str, Callable[[], Any]]] = [
+        ("database", lambda: database_cases(rows, only)),
+        ("tools", tool_cases),
+        ("memory", memory_cases),
+        ("prompt", prompt_cases),
+        ("message_json", message_json_cases),
+        ("validation", validation_cases),
+    ]
+    for name, factory in groups:
+        try:
+            result = factory()
+            cases.extend(await result if asyncio.iscoroutine(result) else result)
+        except ImportError as e:
+            print(f"Skipping {name} cases: {e}", file=sys.stderr)
+    return [case for case in cases if only in case[0]]
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--rows", default="100,10000,100000")
+    parser.add_argument("--only", default="", help="Only run cases whose name contains this.")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="Store the results as the baseline.")
+    parser.add_argument("--compare", action="store_true", help="Compare the results with the baseline.")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+    # The cases run inside a temporary directory; a relative path has to
+    # point at the directory it was given from.
+    args.baseline = args.baseline.resolve()
+    if args.compare and not args.baseline.exists():
+        sys.exit(f"No baseline at {args.baseline}, create one with --save first.")
+
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        for name, fn, is_async in await collect_cases([int(rows) for rows in args.rows.split(",")], args.only):
+            # One untimed call to fill caches the way a running bot would have.
+            if is_async:
+                await fn()
+                samples = await _common.time_async(fn, args.repeat)
+            else:
+                fn()
+                samples = _common.time_sync(fn, args.repeat)
+            results[name] = _common.summarize(samples)
+
+    if args.compare:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = _common.compare(baseline, results, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        _common.report(results)
+
+    if args.save:
+        _common.save_baseline(args.baseline, results)
+        print(f"Saved baseline to {args.baseline}", file=sys.stderr)
+
+if __name__ == "__main__":
+    asyncio.run(main())
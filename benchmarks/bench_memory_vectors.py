@@ -0,0 +1,108 @@
+"""Compare recall, query latency and size of compact memory vectors with full ones.
+
+    python benchmarks/bench_memory_vectors.py [--dims 64,128,256] [--k 5]
+    python benchmarks/bench_memory_vectors.py --synthetic 20000 --dim 1536
+
+Uses the embeddings of the bot's full-size memory collection by default.
+Queries are stored memories with a little noise added; the reference answer is
+an exact float32 search over the full vectors. Synthetic vectors have no
+Matryoshka structure, so truncation looks much worse on them than on real
+embeddings.
+"""
+import _common
+
+import argparse
+
+import numpy as np
+
+from services.vector_compression import QuantizedIndex, VectorReducer, normalize
+
+def load_collection() -> np.ndarray:
+    import chromadb
+    from chromadb.config import Settings
+    from services.embeddings import base_memory_collection_name
+
+    client = chromadb.PersistentClient(path="./db", settings=Settings(anonymized_telemetry=False))
+    data = client.get_or_create_collection(name=base_memory_collection_name()).get(include=["embeddings"])
+    return np.asarray(data["embeddings"], dtype=np.float32)
+
+def synthetic(count: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    # A few dominant directions plus noise, roughly like real text embeddings.
+    centers = rng.normal(size=(64, dim))
+    return centers[rng.integers(0, 64, count)] + 0.5 * rng.normal(size=(count, dim))
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def run(name: str, search, queries: np.ndarray, truth: np.ndarray, bytes_per_vector: int, k: int) -> dict:
+    found = []
+    samples = _common.time_sync(lambda: found.append(search(queries[len(found) % len(queries)])), len(queries))
+    return {
+        "name": name,
+        f"recall@{k}": round(recall(np.asarray(found[:len(queries)]), truth), 4),
+        "bytes_per_vector": bytes_per_vector,
+        "query": _common.summarize(samples),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dims", default="64,128,256")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--synthetic", type=int, default=0, help="Use this many random vectors instead of the collection.")
+    parser.add_argument("--dim", type=int, default=1536, help="Dimension of the synthetic vectors.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = synthetic(args.synthetic, args.dim, rng) if args.synthetic else load_collection()
+    if len(vectors) <= args.k:
+        raise SystemExit("Not enough vectors, pass --synthetic N")
+    vectors = normalize(vectors.astype(np.float32))
+    picks = rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)
+    queries = normalize(vectors[picks] + 0.02 * rng.normal(size=(len(picks), vectors.shape[1])).astype(np.float32))
+    truth = top_k(queries @ vectors.T, args.k)
+    k = args.k
+
+    results = [run("float32", lambda q: top_k((vectors @ q)[None], k)[0], queries, truth, vectors.shape[1] * 4, k)]
+
+    for dim in (int(d) for d in args.dims.split(",")):
+        if dim >= vectors.shape[1]:
+            continue
+        for method in ("truncate", "pca"):
+            reducer = VectorReducer(dim, method)
+            if method == "pca":
+                if len(vectors) < dim:
+                    continue
+                reducer.fit(vectors)
+            reduced = reducer.reduce(vectors)
+            reduced_queries = reducer.reduce(queries)
+            results.append(run(
+                f"{method}{dim}",
+                lambda q: top_k((reduced @ q)[None], k)[0],
+                reduced_queries, truth, dim * 4, k
+            ))
+
+            for kind in ("int8", "binary"):
+                index = QuantizedIndex(kind, args.rerank_factor)
+                index.add([str(i) for i in range(len(reduced))], reduced, [0] * len(reduced))
+
+                def search(q: np.ndarray) -> np.ndarray:
+                    candidates = np.asarray(index.candidates(q, 0, k * index.rerank_factor), dtype=np.int64)
+                    # Float re-ranking of the quantized candidates.
+                    return candidates[np.argsort(-(reduced[candidates] @ q))[:k]]
+
+                # The codes are kept in RAM in addition to the float vectors
+                # used for re-ranking, so count both.
+                results.append(run(
+                    f"{method}{dim}+{kind}",
+                    search, reduced_queries, truth, dim * 4 + index.encode(reduced[:1]).nbytes, k
+                ))
+
+    _common.report({"vectors": len(vectors), "dim": vectors.shape[1], "results": results})
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Compare per-message autocommitted inserts with the group-commit write buffer.
+
+    python benchmarks/bench_message_inserts.py [--rows 2000] [--channels 8]
+
+Runs against a throwaway SQLite database in a temporary directory.
+"""
+import _common
+
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime
+
+from services.database import DatabaseService, Message, MessageIndex, insert_messages, write_buffer
+
+def make_row(channel_id: int, index: int) -> dict:
+    content = f'{{"message_type": "user_message", "content": "message number {index}"}}'
+    return {
+        "channel_id": channel_id,
+        "role": "user",
+        "content": content,
+        "image_url": None,
+        "message_id": index,
+        "timestamp": datetime.now(),
+        "guild_id": 1,
+        "index_text": DatabaseService.searchable_text(content),
+    }
+
+def autocommit(rows: int, channels: int) -> float:
+    start = time.perf_counter()
+    for index in range(rows):
+        insert_messages([make_row(index % channels, index)])
+    return time.perf_counter() - start
+
+async def buffered(db: DatabaseService, rows: int, channels: int) -> float:
+    async def channel_writer(channel_id: int) -> None:
+        for index in range(channel_id, rows, channels):
+            # Waits for the group commit its row joined, like a real turn.
+            await db.add_message(channel_id, "user", f"message number {index}", None, index, guild_id=1)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(channel_writer(channel_id) for channel_id in range(channels)))
+    await db.flush_writes()
+    return time.perf_counter() - start
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--channels", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        db = DatabaseService(db_path=os.path.join(tmp, "database.db"))
+        await db.init_db()
+
+        direct = autocommit(args.rows, args.channels)
+        MessageIndex.delete().execute()
+        Message.delete().execute()
+        grouped = await buffered(db, args.rows, args.channels)
+
+        _common.report({
+            "rows": args.rows,
+            "channels": args.channels,
+            "autocommit_rows_per_s": round(args.rows / direct),
+            "buffered_rows_per_s": round(args.rows / grouped),
+            "speedup": round(direct / grouped, 2),
+            "buffer": write_buffer.stats(),
+        })
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+"""Compare the full response schema with one pruned of disabled tools.
+
+    python benchmarks/bench_schema_decode.py [--disable dice_roll,generate_image] [--repeat 5]
+
+Always prints the schema sizes. With --ollama it also runs the same prompt
+against OLLAMA_MODEL under both schemas and reports decode speed from
+eval_count / eval_duration.
+"""
+import _common
+
+import json
+import asyncio
+import argparse
+
+from decouple import config
+
+from utils.models import ToolArgs, get_reasoning_model, tool_type_of
+
+PROMPT = [
+    {"role": "system", "content": "You are a Discord bot. Reply to the user with a single send_message tool call."},
+    {"role": "user", "content": "Hey, what's a good name for a pet snail?"},
+]
+
+def schema_size(model) -> dict:
+    schema = json.dumps(model.model_json_schema())
+    return {"bytes": len(schema), "definitions": schema.count('"tool_type"')}
+
+async def decode(client, model_name: str, response_model, repeat: int) -> dict:
+    rates, latencies = [], []
+    for _ in range(repeat):
+        response = await client.chat(
+            model=model_name,
+            messages=PROMPT,
+            format=response_model.model_json_schema(),
+            options={"temperature": 0},
+        )
+        if response.eval_duration:
+            rates.append(response.eval_count / (response.eval_duration / 1e9))
+        latencies.append(response.total_duration / 1e9)
+    return {
+        "tokens_per_s": round(sum(rates) / len(rates), 2) if rates else None,
+        "total": _common.summarize(latencies),
+    }
+
+async def main() -> None:
+    all_tools = sorted(tool_type_of(tool) for tool in ToolArgs.__args__)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", default="fast")
+    parser.add_argument("--disable", default=",".join(tool for tool in all_tools if tool != "send_message"))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--ollama", action="store_true")
+    args = parser.parse_args()
+
+    disabled = frozenset(tool for tool in args.disable.split(",") if tool)
+    full = get_reasoning_model(args.mode, True)
+    pruned = get_reasoning_model(args.mode, True, disabled)
+
+    results = {
+        "disabled": sorted(disabled),
+        "full_schema": schema_size(full),
+        "pruned_schema": schema_size(pruned),
+    }
+
+    if args.ollama:
+        from ollama import AsyncClient
+        client = AsyncClient(host=config("OLLAMA_HOST"))
+        model_name = config("OLLAMA_MODEL")
+        # Load the model first so neither side pays for it.
+        await client.generate(model=model_name, prompt="", keep_alive=config("OLLAMA_KEEP_ALIVE", default="30m"))
+        results["full_decode"] = await decode(client, model_name, full, args.repeat)
+        results["pruned_decode"] = await decode(client, model_name, pruned, args.repeat)
+
+    _common.report(results)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,8 +1,15 @@
 from __future__ import annotations
 
+import os
 import sys
+import json
+import time
+import resource
+import asyncio
+import hashlib
 import logging
 from pathlib import Path
+from typing import Any, Dict, Optional
 import coloredlogs
 
 import discord
@@ -17,19 +24,66 @@ class Bot(commands.Bot):
         self.bot_name = config("NAME")
         self.persona = config("PERSONA", default="A deep thinker named bot3.")
         self.dev_id = config('DEV_ID', cast=int)
+        self.force_sync = config('FORCE_COMMAND_SYNC', default=False, cast=bool) or '--sync' in sys.argv
+        self.sync_state_path = Path('./db/command_tree.json')
+        self.cog_handoff: Dict[str, Dict[str, Any]] = {}
+        self.lean_gateway = config('LEAN_GATEWAY', default=False, cast=bool)
+        self.started_at = time.perf_counter()
+        self.ready_seconds: Optional[float] = None
         self._log_startup()
         
         super().__init__(
             command_prefix=':',
-            intents=discord.Intents.all(),
             case_insensitive=True,
-            description=f"{self.bot_name} - An experimental deep thinker."
+            description=f"{self.bot_name} - An experimental deep thinker.",
+            **self._gateway_options()
         )
         
     def _log_startup(self) -> None:
         self.logger.info(f'Starting {self.bot_name}...')
         self.logger.info(f'Backend type: {self.backend}')
         self.logger.info(f'Developer ID: {self.dev_id}')
+        self.logger.info(f'Gateway profile: {"lean" if self.lean_gateway else "full"}')
+
+    def _gateway_options(self) -> Dict[str, Any]:
+        if not self.lean_gateway:
+            return {'intents': discord.Intents.all()}
+
+        # Only what the AI cog uses: guild messages and their content, plus
+        # voice states so voice replies can join a channel. No members or
+        # presences are received or cached, and guilds aren't chunked.
+        intents = discord.Intents.none()
+        intents.guilds = True
+        intents.guild_messages = True
+        intents.message_content = True
+        intents.voice_states = True
+        max_messages = config('GATEWAY_MAX_MESSAGES', default=100, cast=int)
+        return {
+            'intents': intents,
+            'member_cache_flags': discord.MemberCacheFlags.none(),
+            'max_messages': max_messages if max_messages > 0 else None,
+            'chunk_guilds_at_startup': False,
+        }
+
+    @staticmethod
+    def rss_mb() -> float:
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+        except (OSError, ValueError):
+            # Peak rather than current RSS; kilobytes on Linux, bytes on macOS.
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+    def process_stats(self) -> Dict[str, Any]:
+        return {
+            'gateway': 'lean' if self.lean_gateway else 'full',
+            'rss_mb': round(self.rss_mb(), 1),
+            'ready_s': round(self.ready_seconds, 2) if self.ready_seconds is not None else None,
+            'guilds': len(self.guilds),
+            'cached_users': len(self.users),
+            'cached_messages': len(self.cached_messages),
+        }
 
     def _setup_logging(self) -> None:
         logging.basicConfig(
@@ -50,26 +104,101 @@ class Bot(commands.Bot):
             self.logger.error(f'Cogs directory not found: {cogs_dir}')
             return
 
-        for cog_file in cogs_dir.glob('*.py'):
-            if cog_file.name == '__init__.py':
-                continue
+        await asyncio.gather(*(
+            self._load_extension(cog_file.stem)
+            for cog_file in cogs_dir.glob('*.py')
+            if cog_file.name != '__init__.py'
+        ))
+
+        await self.sync_commands()
+
+    async def _load_extension(self, name: str) -> None:
+        try:
+            await self.load_extension(f'cogs.{name}')
+            self.logger.info(f'Loaded extension: {name}')
+        except Exception as e:
+            self.logger.error(f'Failed to load {name}: {e}')
+
+    async def hot_reload(self, name: str) -> float:
+        module = f'cogs.{name}'
+        if module not in self.extensions:
+            raise commands.ExtensionNotLoaded(module)
+
+        start = time.perf_counter()
+        # Cogs that can export their state hand it to the instances the
+        # reloaded module creates, instead of shutting down and starting cold.
+        for cog in list(self.cogs.values()):
+            if cog.__module__ == module and hasattr(cog, 'export_state'):
+                self.cog_handoff[cog.qualified_name] = cog.export_state()
+
+        try:
+            await self.reload_extension(module)
+        finally:
+            unclaimed = list(self.cog_handoff)
+            self.cog_handoff.clear()
+            if unclaimed:
+                self.logger.warning(f'State of {", ".join(unclaimed)} was not picked up after reloading {name}')
+
+        seconds = time.perf_counter() - start
+        self.logger.info(f'Hot reloaded extension {name} in {seconds * 1000:.0f}ms')
+        await self.sync_commands()
+        return seconds
 
+    def _command_tree_hash(self) -> str:
+        commands_payload = []
+        for command in self.tree.get_commands():
             try:
-                await self.load_extension(f'cogs.{cog_file.stem}')
-                self.logger.info(f'Loaded extension: {cog_file.stem}')
-            except Exception as e:
-                self.logger.error(f'Failed to load {cog_file.stem}: {e}')
+                commands_payload.append(command.to_dict(self.tree))
+            except TypeError:
+                # discord.py < 2.4 doesn't take the tree.
+                commands_payload.append(command.to_dict())
+        # The same tree still has to be synced once for a different bot
+        # account (e.g. a test bot sharing the ./db directory).
+        payload = {'application_id': self.application_id, 'commands': commands_payload}
+        serialized = json.dumps(payload, sort_keys=True, default=str)
+        return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
 
+    def _read_sync_state(self) -> dict:
         try:
+            return json.loads(self.sync_state_path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    async def sync_commands(self, force: bool = False) -> None:
+        force = force or self.force_sync
+        tree_hash = self._command_tree_hash()
+        state = self._read_sync_state()
+
+        if not force and state.get('hash') == tree_hash:
+            self.logger.info(f'Command tree unchanged, skipped sync (saved ~{state.get("seconds", 0):.2f}s)')
+            return
+
+        try:
+            start = time.perf_counter()
             synced = await self.tree.sync()
-            self.logger.info(f'Synced {len(synced)} application commands')
+            seconds = time.perf_counter() - start
+            self.logger.info(f'Synced {len(synced)} application commands in {seconds:.2f}s')
         except discord.HTTPException as e:
             self.logger.error(f'Failed to sync commands: {e}')
+            return
+
+        try:
+            self.sync_state_path.parent.mkdir(parents=True, exist_ok=True)
+            self.sync_state_path.write_text(json.dumps({'hash': tree_hash, 'seconds': seconds}))
+        except OSError as e:
+            self.logger.warning(f'Failed to store command tree hash: {e}')
 
     async def on_ready(self) -> None:
         await self._set_presence()
         
         self.logger.info(f'Bot is ready! Logged in as {self.user} (ID: {self.user.id})')
+        if self.ready_seconds is None:
+            self.ready_seconds = time.perf_counter() - self.started_at
+            stats = self.process_stats()
+            self.logger.info(
+                f'Ready after {stats["ready_s"]:.2f}s with the {stats["gateway"]} gateway profile: '
+                f'{stats["guilds"]} guilds, {stats["cached_users"]} cached users, RSS {stats["rss_mb"]:.0f}MB'
+            )
 
     async def _set_presence(self) -> None:
         await self.change_presence(
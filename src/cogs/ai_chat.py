@@ -5,25 +5,62 @@ from discord.ext import commands
 
 from services.infer import OpenAI, Ollama
 from utils.discord_utils import DiscordUtils
-from utils.models import ReasoningModel
+from utils.models import ReasoningModel, ReasoningMode, REASONING_MODES, get_reasoning_model
+from utils.metrics import LatencyStats
 from utils.tools import get_tool_info
-from services.database import DatabaseService
-from utils.get_prompt import generate_system_prompt
+from services.database import get_database_service, write_buffer
+from services.memory_consolidation import MemoryConsolidator
+from services.memory_prefetch import MemoryPrefetcher
+from services.router import ModelRouter
+from utils.get_prompt import generate_system_prompt, format_prefetched_memories
+from utils.profiler import MessageProfiler
+from utils.loop_monitor import LoopMonitor
+from utils.message_cache import CachedMessage
 
-from typing import Optional, Dict
+from typing import Any, Optional, Dict, List, Tuple, Type, Literal
+from decouple import config
 import json
 import logging
 import asyncio
+import time
 import io
 
 class AI(commands.GroupCog, name="ai"):
+    # Live state handed from the old to the new instance on a hot reload.
+    HANDOFF_ATTRS = (
+        "dc_utils", "db", "ongoing_tasks", "profiler", "loop_monitor", "mode_latency",
+        "client", "router", "consolidator", "prefetcher",
+    )
+    
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.dc_utils = DiscordUtils(bot=bot)
-        self.db = DatabaseService()
         self.logger = logging.getLogger(__name__)
-        self.ongoing_tasks: Dict[int, asyncio.Task] = {}
+        self.history_window = config("HISTORY_WINDOW", default=0, cast=int)
+        self.default_reasoning_mode = config("REASONING_MODE", default="deep")
+        if self.default_reasoning_mode not in REASONING_MODES:
+            self.logger.warning(
+                f"Unknown REASONING_MODE {self.default_reasoning_mode!r}, expected one of "
+                f"{', '.join(REASONING_MODES)}; falling back to 'deep'"
+            )
+            self.default_reasoning_mode = "deep"
+        
+        state = bot.cog_handoff.pop(self.qualified_name, None)
+        self.adopted = state is not None
+        if self.adopted:
+            for name in self.HANDOFF_ATTRS:
+                setattr(self, name, state[name])
+            return
+        
         self._get_client()
+        self.dc_utils = DiscordUtils(bot=bot, client=self.client)
+        self.db = get_database_service()
+        self.ongoing_tasks: Dict[int, asyncio.Task] = {}
+        self.profiler = MessageProfiler()
+        self.loop_monitor = LoopMonitor()
+        self.mode_latency = {mode: LatencyStats() for mode in REASONING_MODES}
+        self.router = ModelRouter(self.client, self.bot.backend)
+        self.consolidator = MemoryConsolidator(self.client.collection)
+        self.prefetcher = MemoryPrefetcher(self.client)
         
     def _get_client(self):
         if self.bot.backend == 'openai':
@@ -32,12 +69,35 @@ class AI(commands.GroupCog, name="ai"):
             self.client = Ollama()
         else:
             raise ValueError("Invalid backend type.")
+    
+    def export_state(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.HANDOFF_ATTRS}
 
     async def cog_load(self):
+        if self.adopted:
+            # Everything below is already running from the previous instance.
+            return
         await self.db.init_db()
+        if self.bot.backend == 'ollama':
+            self.client.start_warmup()
+        if self.client.local_embeddings is not None:
+            asyncio.create_task(self.client.local_embeddings.warmup())
+        self.consolidator.start()
+        self.loop_monitor.start()
+
+    async def cog_unload(self):
+        if self.qualified_name in self.bot.cog_handoff:
+            # Being reloaded, the next instance takes over the running services.
+            return
+        if self.bot.backend == 'ollama':
+            self.client.stop_warmup()
+        self.consolidator.stop()
+        self.loop_monitor.stop()
+        await self.dc_utils.outbound.drain()
+        await self.db.flush_writes()
         
     async def get_tool_list(self, guild_id: int) -> list[str]:
-        tools = await get_tool_info(guild_id, omit_disabled=True)
+        tools = await get_tool_info(guild_id)
         tools = tools.split("\n")
         tool_list = []
         for tool in tools:
@@ -78,17 +138,20 @@ class AI(commands.GroupCog, name="ai"):
             for tool in filtered_tools[:25]
         ]
 
-    def create_message_json(self, message: discord.Message) -> str:
-        if message.reference and len(message.reference.resolved.content) > 30:
-            message.reference.resolved.content = message.reference.resolved.content[:30] + "..."
+    def create_message_json(self, message: discord.Message, reference: Optional[CachedMessage] = None) -> str:
+        reference_content = None
+        if reference is not None:
+            reference_content = reference.content
+            if len(reference_content) > 30:
+                reference_content = reference_content[:30] + "..."
             
         return json.dumps({
             "message_type": "user_message",
             "user_name": message.author.display_name,
             "user_id": message.author.id,
             "content": message.content,
-            "reference_user_id": message.reference.resolved.author.id if message.reference else None,
-            "reference": message.reference.resolved.content if message.reference else None,
+            "reference_user_id": reference.author_id if reference else None,
+            "reference": reference_content,
             "timestamp": message.created_at.strftime("%Y-%m-%d %H:%M:%S")
         }, indent=4)
 
@@ -99,23 +162,55 @@ class AI(commands.GroupCog, name="ai"):
             "content": str(error)
         }, indent=4)
 
-    async def process_ai_response(self, message: discord.Message, response: ReasoningModel) -> Optional[str]:
+    async def process_ai_response(self, message: discord.Message, response: ReasoningModel) -> List[Optional[str]]:
         try:
-            return_json = await self.dc_utils.handle_tools(message, response)
-            return return_json
+            return await self.dc_utils.handle_tools(message, response)
         except Exception as e:
             self.logger.error(f"Error processing AI response: {e}")
-            return self.create_error_json(response.tool_args.tool_type, e)
+            return [self.create_error_json(tool_args.tool_type, e) for tool_args in response.tool_args]
+
+    def merge_tool_returns(self, return_jsons: List[Optional[str]]) -> Tuple[Optional[str], List[str]]:
+        returns = []
+        image_urls = []
+        for return_json in return_jsons:
+            if not return_json:
+                continue
+            msg_json = json.loads(return_json)
+            if msg_json['tool_type'] == "generate_image" and msg_json['message_type'] != "error_message":
+                image_urls.append(msg_json['content'])
+                msg_json['content'] = "Image generated."
+            returns.append(msg_json)
+        
+        if not returns:
+            return None, []
+        if len(returns) == 1:
+            return json.dumps(returns[0], indent=4), image_urls
+        return json.dumps(returns, indent=4), image_urls
 
-    async def generate_response(self, channel_id: int, system_prompt: str) -> ReasoningModel:
+    async def cache_attachment(self, message: discord.Message) -> Optional[str]:
+        if not message.attachments:
+            return None
+        try:
+            return await self.db.image_cache.store_bytes(await message.attachments[0].read())
+        except Exception as e:
+            self.logger.warning(f"Failed to cache attachment, storing its URL instead: {e}")
+            return message.attachments[0].url
+
+    async def generate_response(self, channel_id: int, system_prompt: str, response_model: Type[ReasoningModel] = ReasoningModel) -> ReasoningModel:
         messages = [{"role": "system", "content": system_prompt}]
-        messages.extend(await self.db.get_channel_history(channel_id))
+        with self.profiler.phase(channel_id, "db"):
+            messages.extend(await self.db.get_channel_history(channel_id, limit=self.history_window))
         
-        response = await self.client.generate_response(messages)
+        with self.profiler.phase(channel_id, "model"):
+            response = await self.router.generate_response(messages, response_model)
         
         return response
 
     async def handle_message(self, message: discord.Message, is_edit: bool = False):
+        with self.profiler.message(message.channel.id):
+            await self._handle_message(message, is_edit)
+
+    async def _handle_message(self, message: discord.Message, is_edit: bool = False):
         channel_id = message.channel.id
         
         if channel_id in self.ongoing_tasks:
@@ -126,60 +221,81 @@ class AI(commands.GroupCog, name="ai"):
                 pass
             
         try:
-            system_prompt = await generate_system_prompt(self.bot, message.channel)
-            message_json = self.create_message_json(message)
+            mode = await self.db.get_reasoning_mode(channel_id, message.guild.id) or self.default_reasoning_mode
+            disabled_tools = frozenset(await self.db.get_disabled_tools(message.guild.id))
+            response_model = get_reasoning_model(mode, self.client.schema_length_limit, disabled_tools)
             
-            if is_edit:
-                await self.db.update_message(
-                    message.channel.id,
-                    message.id,
-                    message_json,
-                    message.edited_at
+            with self.profiler.phase(channel_id, "prompt"):
+                # Memories are looked up while the prompt is built and appended
+                # at the end, so the rest of the prompt stays identical between
+                # turns.
+                system_prompt, memories, reference = await asyncio.gather(
+                    generate_system_prompt(self.bot, message.channel, mode),
+                    self.prefetcher.prefetch(message.content, message.guild.id),
+                    self.dc_utils.message_cache.resolve(message)
                 )
+                system_prompt += format_prefetched_memories(memories)
+                message_json = self.create_message_json(message, reference)
+            
+            if is_edit:
+                with self.profiler.phase(channel_id, "db"):
+                    await self.db.update_message(
+                        message.channel.id,
+                        message.id,
+                        message_json,
+                        message.edited_at
+                    )
             else:
-                await self.db.add_message(
-                    message.channel.id,
-                    "user",
-                    message_json,
-                    message.attachments[0].url if message.attachments else None,
-                    message.id
-                )
+                image_url = await self.cache_attachment(message)
+                with self.profiler.phase(channel_id, "db"):
+                    await self.db.add_message(
+                        message.channel.id,
+                        "user",
+                        message_json,
+                        image_url,
+                        message.id,
+                        guild_id=message.guild.id
+                    )
 
             async def process_message():
+                called_retrieve = False
                 try:
                     while True:
-                        response = await self.generate_response(message.channel.id, system_prompt)
+                        response = await self.generate_response(message.channel.id, system_prompt, response_model)
                         if not response.tool_args:
                             break
+                        called_retrieve = called_retrieve or any(tool_args.tool_type == "memory_retrieve" for tool_args in response.tool_args)
                         
-                        return_json = await self.process_ai_response(message, response)
+                        with self.profiler.phase(channel_id, "tools"):
+                            return_jsons = await self.process_ai_response(message, response)
                         
                         del response.reasoning
-                        await self.db.add_message(
-                            message.channel.id,
-                            "assistant", 
-                            json.dumps(response.model_dump(), indent=4),
-                            None
-                        )
-                            
-                        if response.tool_args.tool_type == "send_message" and not response.tool_args.call_another_tool:
-                            break
-
+                        with self.profiler.phase(channel_id, "db"):
+                            await self.db.add_message(
+                                message.channel.id,
+                                "assistant", 
+                                json.dumps(response.model_dump(), indent=4),
+                                None,
+                                guild_id=message.guild.id
+                            )
+                        
+                        # All results of this turn are fed back as one message,
+                        # so the model sees them together in a single follow-up.
+                        return_json, img_urls = self.merge_tool_returns(return_jsons)
                         if return_json:
-                            if response.tool_args.tool_type == "generate_image":
-                                msg_json = json.loads(return_json)
-                                if msg_json['message_type'] == "error_message":
-                                    await self.db.add_message(message.channel.id, "user", return_json, None)
-                                else:
-                                    img_url = msg_json['content'][:]
-                                    msg_json['content'] = "Image generated."
-                                    return_json = json.dumps(msg_json, indent=4)
-                                    await self.db.add_message(message.channel.id, "user", return_json, img_url)
-                            else:
-                                await self.db.add_message(message.channel.id, "user", return_json, None)
-                        else:
+                            with self.profiler.phase(channel_id, "db"):
+                                await self.db.add_message(message.channel.id, "user", return_json, img_urls, guild_id=message.guild.id)
+                        
+                        # A sent message that doesn't ask for another tool ends
+                        # the turn, unless it failed and the model should see why.
+                        finished = any(
+                            tool_args.tool_type == "send_message" and not tool_args.call_another_tool and return_jsons[index] is None
+                            for index, tool_args in enumerate(response.tool_args)
+                        )
+                        if finished or not return_json:
                             break
                         
+                    self.prefetcher.record_turn(memories, called_retrieve)
                 finally:
                     if channel_id in self.ongoing_tasks:
                         del self.ongoing_tasks[channel_id]
@@ -188,7 +304,9 @@ class AI(commands.GroupCog, name="ai"):
             self.ongoing_tasks[channel_id] = task
             
             try:
+                start = time.perf_counter()
                 await task
+                self.mode_latency[mode].record(time.perf_counter() - start)
             except asyncio.CancelledError:
                 self.logger.info(f"Task cancelled for channel {channel_id}")
             except Exception as e:
@@ -282,6 +400,18 @@ class AI(commands.GroupCog, name="ai"):
         else:
             await i.followup.send("-# An unknown logic occured.")
             
+    @app_commands.command(description="Sets how much the AI thinks before answering.")
+    @app_commands.describe(mode="fast: short reasoning, normal: moderate, deep: extensive reasoning.", scope="Apply to this channel or the whole server.")
+    async def reasoning(self, i: I, mode: ReasoningMode, scope: Literal["channel", "server"] = "channel"):
+        await i.response.defer()
+        
+        if i.user.guild_permissions.manage_messages or i.user.id == self.bot.dev_id:
+            await self.db.set_reasoning_mode(i.channel_id if scope == "channel" else i.guild_id, mode)
+            where = "this channel" if scope == "channel" else "this server"
+            await i.followup.send(f"-# Reasoning mode set to {mode} in {where}.")
+        else:
+            await i.followup.send("-# You do not have permission to use this command!")
+            
     @app_commands.command(description="List all the tools available for the AI.")
     async def tools(self, i: I):
         await i.response.defer()
@@ -328,8 +458,105 @@ class AI(commands.GroupCog, name="ai"):
         else:
             await i.followup.send("-# You do not have permission to use this command!")
     
+    def collect_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            "process": self.bot.process_stats(),
+            "tts_cache": self.dc_utils.tts_cache.stats(),
+            "audio_encoder": self.dc_utils.audio_encoder.stats(),
+            "voice_stream": self.dc_utils.voice_streamer.stats(),
+            "outbound": self.dc_utils.outbound.stats(),
+            "reply_refs": self.dc_utils.message_cache.stats(),
+            "memory_consolidation": self.consolidator.stats(),
+            "memory_prefetch": self.prefetcher.stats(),
+            "memory_vectors": self.client.compression.stats() if self.client.compression else {"dim": "full"},
+            "db_writes": write_buffer.stats(),
+            "routing": self.router.stats(),
+            "event_loop": self.loop_monitor.stats(),
+            "reasoning_modes": {
+                f"{mode}_{key}": value
+                for mode, stats in self.mode_latency.items()
+                for key, value in stats.summary().items()
+            },
+        }
+
+    @app_commands.command(description="Shows runtime statistics (developer only).")
+    async def stats(self, i: I):
+        await i.response.defer(ephemeral=True)
+        
+        if i.user.id != self.bot.dev_id:
+            await i.followup.send("-# You do not have permission to use this command!")
+            return
+        
+        lines = []
+        for section, values in self.collect_stats().items():
+            lines.append(f"[{section}]")
+            lines.extend(f"{key}: {value}" for key, value in values.items())
+            lines.append("")
+        
+        content = "```ini\n" + "\n".join(lines).strip()[:1980] + "\n```"
+        await i.followup.send(content)
+    
+    @app_commands.command(description="Profiles the next messages handled in a channel (developer only).")
+    @app_commands.describe(messages="Number of messages to profile.", seconds="Profile every message for this many seconds instead.")
+    async def profile(self, i: I, messages: Optional[int] = 5, seconds: Optional[int] = None, channel: Optional[discord.TextChannel] = None):
+        await i.response.defer(ephemeral=True)
+        
+        if i.user.id != self.bot.dev_id:
+            await i.followup.send("-# You do not have permission to use this command!")
+            return
+        
+        channel = channel or i.channel
+        report_channel = i.channel
+        
+        async def report(summary: str):
+            await report_channel.send(f"```\n{summary[:1990]}\n```")
+        
+        if seconds:
+            self.profiler.arm(channel.id, seconds=seconds, on_finish=report)
+            await i.followup.send(f"-# Profiling every message in {channel.mention} for {seconds}s.")
+        else:
+            self.profiler.arm(channel.id, messages=max(1, messages or 1), on_finish=report)
+            await i.followup.send(f"-# Profiling the next {max(1, messages or 1)} message(s) in {channel.mention}.")
+    
+    @app_commands.command(description="Shows event loop lag and the code that blocked it (developer only).")
+    @app_commands.describe(limit="Number of offenders to show.", reset="Clear the collected offenders afterwards.")
+    async def loop(self, i: I, limit: Optional[int] = 5, reset: Optional[bool] = False):
+        await i.response.defer(ephemeral=True)
+        
+        if i.user.id != self.bot.dev_id:
+            await i.followup.send("-# You do not have permission to use this command!")
+            return
+        
+        if not self.loop_monitor.enabled:
+            await i.followup.send("-# The event loop monitor is disabled (LOOP_MONITOR).")
+            return
+        
+        summary = self.loop_monitor.summary(max(1, limit or 1))
+        if reset:
+            self.loop_monitor.reset()
+        await i.followup.send(f"```\n{summary[:1990]}\n```")
+    
+    @app_commands.command(description="Reloads an extension in place, keeping its running state (developer only).")
+    @app_commands.describe(extension="Extension in src/cogs to reload.")
+    async def reload(self, i: I, extension: Optional[str] = "ai_chat"):
+        await i.response.defer(ephemeral=True)
+        
+        if i.user.id != self.bot.dev_id:
+            await i.followup.send("-# You do not have permission to use this command!")
+            return
+        
+        try:
+            seconds = await self.bot.hot_reload(extension)
+        except Exception as e:
+            self.logger.error(f"Failed to reload {extension}: {e}", exc_info=True)
+            await i.followup.send(f"-# Failed to reload {extension}: {e}")
+            return
+        await i.followup.send(f"-# Reloaded {extension} in {seconds * 1000:.0f}ms.")
+    
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
+        if message.guild is not None:
+            self.dc_utils.message_cache.remember(message)
         if message.author.bot:
             return
         if message.guild is None:
@@ -354,6 +581,8 @@ class AI(commands.GroupCog, name="ai"):
 
     @commands.Cog.listener()
     async def on_message_edit(self, before: discord.Message, after: discord.Message):
+        if after.guild is not None:
+            self.dc_utils.message_cache.remember(after)
         if before.author.bot:
             return
         if before.guild is None:
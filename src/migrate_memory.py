@@ -0,0 +1,152 @@
+"""Copy the memory collection into its compact form.
+
+    python src/migrate_memory.py [--refit] [--batch 500] [--drop-source]
+    python src/migrate_memory.py --normalize
+    python src/migrate_memory.py --reembed
+
+Reads the full-size collection (MEMORY_COLLECTION, or memory / memory_local),
+reduces every stored embedding to MEMORY_VECTOR_DIM dimensions with
+MEMORY_VECTOR_REDUCTION and writes it to the collection the bot uses with
+those settings. Nothing is re-embedded. With MEMORY_VECTOR_REDUCTION=pca the
+projection is fitted on the source collection first and saved next to it.
+
+--normalize instead rescales the vectors of the collection the bot uses to
+unit length in place. Memories stored by Ollama before embeddings were
+normalized need this for similarity scores to be meaningful.
+
+--reembed copies the memories of the remote-embedding collection into the
+local one (EMBEDDING_BACKEND=local), embedding their text again with
+LOCAL_EMBEDDING_MODEL.
+"""
+import os
+import time
+import asyncio
+import logging
+import argparse
+
+import numpy as np
+import chromadb
+from chromadb.config import Settings
+
+from services.embeddings import (
+    base_memory_collection_name, get_local_embeddings, memory_collection_name,
+    remote_memory_collection_name, use_local_embeddings
+)
+from services.vector_compression import VectorCompression, normalize
+
+def directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+def normalize_collection(batch: int, logger: logging.Logger) -> None:
+    client = chromadb.PersistentClient(path="./db", settings=Settings(anonymized_telemetry=False))
+    collection = client.get_or_create_collection(name=memory_collection_name())
+    data = collection.get(include=["embeddings"])
+    if not data["ids"]:
+        raise SystemExit(f"Collection {collection.name} is empty.")
+    embeddings = np.asarray(data["embeddings"], dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1)
+    changed = np.nonzero(np.abs(norms - 1) > 1e-3)[0]
+    normalized = normalize(embeddings[changed])
+    for offset in range(0, len(changed), batch):
+        rows = changed[offset:offset + batch]
+        collection.update(ids=[data["ids"][i] for i in rows], embeddings=normalized[offset:offset + batch].tolist())
+    logger.info(f"Normalized {len(changed)} of {len(data['ids'])} memories in {collection.name}")
+
+def reembed_collection(batch: int, logger: logging.Logger) -> None:
+    if not use_local_embeddings():
+        raise SystemExit("EMBEDDING_BACKEND is not local, there is nothing to re-embed for.")
+    source_name, target_name = remote_memory_collection_name(), memory_collection_name()
+    client = chromadb.PersistentClient(path="./db", settings=Settings(anonymized_telemetry=False))
+    source = client.get_or_create_collection(name=source_name)
+    target = client.get_or_create_collection(name=target_name)
+    compression = VectorCompression.from_config(target)
+    embeddings = get_local_embeddings()
+
+    start = time.perf_counter()
+    data = source.get(include=["documents", "metadatas"])
+    if not data["ids"]:
+        raise SystemExit(f"Collection {source_name} is empty.")
+    for offset in range(0, len(data["ids"]), batch):
+        end = offset + batch
+        vectors = asyncio.run(embeddings.embed_many(data["documents"][offset:end]))
+        if compression is not None:
+            vectors = [compression.reduce(vector) for vector in vectors]
+        target.upsert(
+            ids=data["ids"][offset:end],
+            embeddings=vectors,
+            documents=data["documents"][offset:end],
+            metadatas=data["metadatas"][offset:end]
+        )
+    logger.info(f"Re-embedded {len(data['ids'])} memories from {source_name} into {target_name} in {time.perf_counter() - start:.1f}s")
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--refit", action="store_true", help="Fit the PCA again even if one exists.")
+    parser.add_argument("--drop-source", action="store_true", help="Delete the full-size collection afterwards.")
+    parser.add_argument("--normalize", action="store_true", help="Only rescale the current collection's vectors to unit length.")
+    parser.add_argument("--reembed", action="store_true", help="Embed the remote collection's memories with the local model.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logger = logging.getLogger("migrate_memory")
+
+    if args.normalize:
+        normalize_collection(args.batch, logger)
+        return
+    if args.reembed:
+        reembed_collection(args.batch, logger)
+        return
+
+    source_name, target_name = base_memory_collection_name(), memory_collection_name()
+    if source_name == target_name:
+        raise SystemExit("MEMORY_VECTOR_DIM is not set, there is nothing to migrate to.")
+
+    client = chromadb.PersistentClient(path="./db", settings=Settings(anonymized_telemetry=False))
+    source = client.get_or_create_collection(name=source_name)
+    target = client.get_or_create_collection(name=target_name)
+    compression = VectorCompression.from_config(target)
+    reducer = compression.reducer
+
+    start = time.perf_counter()
+    data = source.get(include=["embeddings", "documents", "metadatas"])
+    if not data["ids"]:
+        raise SystemExit(f"Collection {source_name} is empty.")
+    embeddings = np.asarray(data["embeddings"], dtype=np.float32)
+    logger.info(f"Read {len(data['ids'])} memories of {embeddings.shape[1]} dimensions from {source_name}")
+
+    if reducer.method == "pca" and (args.refit or not reducer.fitted):
+        reducer.fit(embeddings)
+        logger.info(f"Fitted PCA to {reducer.dim} dimensions, saved to {reducer.path}")
+
+    reduced = reducer.reduce(embeddings)
+    for offset in range(0, len(data["ids"]), args.batch):
+        end = offset + args.batch
+        target.upsert(
+            ids=data["ids"][offset:end],
+            embeddings=reduced[offset:end].tolist(),
+            documents=data["documents"][offset:end],
+            metadatas=data["metadatas"][offset:end]
+        )
+
+    logger.info(
+        f"Wrote {len(reduced)} memories to {target_name} in {time.perf_counter() - start:.1f}s: "
+        f"{embeddings.shape[1] * 4}B -> {reducer.dim * 4}B per vector"
+    )
+    if compression.index is not None:
+        logger.info(
+            f"The {compression.index.kind} index adds {compression.index.encode(reduced[:1]).nbytes}B per vector "
+            f"in memory on top of the float vectors and is built at startup"
+        )
+
+    if args.drop_source:
+        client.delete_collection(source_name)
+        logger.info(f"Deleted {source_name}")
+    logger.info(f"./db is now {directory_size('./db') / 1024 / 1024:.1f}MB")
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,26 @@
 from peewee import *
+from playhouse.sqlite_ext import FTS5Model, SearchField, RowIDField
 
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional, Union
+import re
+import json
+import time
+import asyncio
 import logging
 from datetime import datetime
+from decouple import config
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import os
 
+from services.image_cache import ImageCache
+
 db = SqliteDatabase(None)
 
+# A message can carry several images (e.g. from more than one generate_image
+# call in a turn); their URLs share the image_url column.
+IMAGE_URL_SEPARATOR = "\n"
+
 class Message(Model):
     channel_id = IntegerField()
     role = CharField()
@@ -19,6 +33,100 @@ class Message(Model):
     class Meta:
         database = db
         
+class MessageIndex(FTS5Model):
+    rowid = RowIDField()
+    content = SearchField()
+    channel_id = SearchField(unindexed=True)
+    guild_id = SearchField(unindexed=True)
+
+    class Meta:
+        database = db
+        options = {"tokenize": "porter unicode61"}
+        
+def insert_messages(rows: List[Dict[str, Any]]) -> None:
+    with db.atomic():
+        for row in rows:
+            fields = {key: value for key, value in row.items() if key not in ("guild_id", "index_text")}
+            rowid = Message.insert(**fields).execute()
+            MessageIndex.insert(
+                rowid=rowid,
+                content=row["index_text"],
+                channel_id=row["channel_id"],
+                guild_id=row["guild_id"]
+            ).execute()
+
+class MessageWriteBuffer:
+    """Commits Message inserts on a single writer thread.
+
+    A row is committed right away when no commit is running. Rows that arrive
+    while one is are committed together by the next one, so batches form
+    under load without delaying a lone writer."""
+
+    def __init__(self) -> None:
+        self.max_rows = config("DB_WRITE_BATCH_SIZE", default=64, cast=int)
+        self.pending: List[Dict[str, Any]] = []
+        self.waiters: List[asyncio.Future] = []
+        self.logger = logging.getLogger(__name__)
+        # One thread, so there is a single writing connection and commits
+        # never wait on each other.
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._writer: Optional[asyncio.Task] = None
+
+        self.batches = 0
+        self.rows = 0
+        self.failed = 0
+        self.flush_seconds = 0.0
+
+    def add(self, row: Dict[str, Any]) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(row)
+        self.waiters.append(future)
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._run())
+        return future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self.pending:
+            rows, self.pending = self.pending[:self.max_rows], self.pending[self.max_rows:]
+            waiters, self.waiters = self.waiters[:self.max_rows], self.waiters[self.max_rows:]
+            start = time.perf_counter()
+            try:
+                await loop.run_in_executor(self.executor, insert_messages, rows)
+            except Exception as e:
+                # Every caller whose row was in the batch gets the error, just
+                # as if it had written the row itself.
+                self.failed += len(rows)
+                self.logger.error(f"Error writing {len(rows)} buffered messages to database: {e}")
+                for future in waiters:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.rows += len(rows)
+            self.flush_seconds += time.perf_counter() - start
+            for future in waiters:
+                if not future.done():
+                    future.set_result(None)
+
+    async def drain(self) -> None:
+        # Waits until everything added so far is committed.
+        while self._writer is not None and not self._writer.done():
+            await asyncio.shield(self._writer)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self.pending),
+            "batches": self.batches,
+            "rows": self.rows,
+            "failed": self.failed,
+            "rows_per_batch": round(self.rows / self.batches, 2) if self.batches else 0,
+            "avg_flush_ms": round(self.flush_seconds / self.batches * 1000, 2) if self.batches else 0,
+        }
+
+write_buffer = MessageWriteBuffer()
+
 class EnabledChannels(Model):
     channel_id = IntegerField()
     
@@ -31,6 +139,13 @@ class DisabledChannels(Model):
     class Meta:
         database = db
         
+class ReasoningModes(Model):
+    scope_id = IntegerField()
+    mode = CharField()
+    
+    class Meta:
+        database = db
+        
 class DisabledTools(Model):
     guild_id = IntegerField()
     tool_type = CharField()
@@ -39,10 +154,14 @@ class DisabledTools(Model):
         database = db
 
 class DatabaseService:
+    """Use get_database_service(); every instance re-initializes the shared
+    connection."""
+    
     def __init__(self, db_path: str = "./db/database.db"):
         self.db_path = db_path
         self.logger = logging.getLogger(__name__)
         self.init_path()
+        self.image_cache = ImageCache()
         db.init(self.db_path)
         db.connect()
         db.create_tables([Message])
@@ -54,26 +173,95 @@ class DatabaseService:
     async def init_db(self):
         if not Message.table_exists():
             db.create_tables([Message])
+        if not MessageIndex.table_exists():
+            db.create_tables([MessageIndex])
+            self.rebuild_message_index()
         if not EnabledChannels.table_exists():
             db.create_tables([EnabledChannels])
         if not DisabledChannels.table_exists():
             db.create_tables([DisabledChannels])
         if not DisabledTools.table_exists():
             db.create_tables([DisabledTools])
+        if not ReasoningModes.table_exists():
+            db.create_tables([ReasoningModes])
+            
+    @staticmethod
+    def searchable_text(content: str) -> str:
+        # Messages are stored as JSON; only index the human-readable values.
+        try:
+            data = json.loads(content)
+        except (TypeError, ValueError):
+            return content
+        
+        parts = []
+        def collect(value: Any, key: Optional[str] = None) -> None:
+            if isinstance(value, dict):
+                for child_key, child in value.items():
+                    collect(child, child_key)
+            elif isinstance(value, list):
+                for child in value:
+                    collect(child, key)
+            elif isinstance(value, str) and key not in ("message_type", "tool_type", "timestamp"):
+                parts.append(value)
+        collect(data)
+        return "\n".join(parts)
+    
+    def rebuild_message_index(self) -> None:
+        with db.atomic():
+            MessageIndex.delete().execute()
+            for msg in Message.select().iterator():
+                # Message rows don't record their guild, so backfilled entries
+                # have none. Searches filter by channel, which they do have.
+                MessageIndex.insert(
+                    rowid=msg.id,
+                    content=self.searchable_text(msg.content),
+                    channel_id=msg.channel_id,
+                    guild_id=None
+                ).execute()
             
     async def update_message(self, channel_id: int, message_id: int, content: str, edited_timestamp: datetime) -> None:
+        # The edited message may still be on its way to the database.
+        await write_buffer.drain()
         try:
-            Message.update(
-                content=content,
-                edited_timestamp=edited_timestamp
-            ).where(
-                (Message.channel_id == channel_id) & 
-                (Message.message_id == message_id)
-            ).execute()
+            with db.atomic():
+                Message.update(
+                    content=content,
+                    edited_timestamp=edited_timestamp
+                ).where(
+                    (Message.channel_id == channel_id) & 
+                    (Message.message_id == message_id)
+                ).execute()
+                rows = Message.select(Message.id).where(
+                    (Message.channel_id == channel_id) & 
+                    (Message.message_id == message_id)
+                )
+                MessageIndex.update(
+                    content=self.searchable_text(content)
+                ).where(MessageIndex.rowid.in_([row.id for row in rows])).execute()
         except Exception as e:
             self.logger.error(f"Error updating message in database: {e}")
             raise
             
+    async def get_reasoning_mode(self, channel_id: int, guild_id: int) -> Optional[str]:
+        try:
+            modes = {
+                row.scope_id: row.mode
+                for row in ReasoningModes.select().where(ReasoningModes.scope_id.in_([channel_id, guild_id]))
+            }
+            return modes.get(channel_id) or modes.get(guild_id)
+        except Exception as e:
+            self.logger.error(f"Error retrieving reasoning mode: {e}")
+            raise
+        
+    async def set_reasoning_mode(self, scope_id: int, mode: str) -> None:
+        try:
+            with db.atomic():
+                ReasoningModes.delete().where(ReasoningModes.scope_id == scope_id).execute()
+                ReasoningModes.create(scope_id=scope_id, mode=mode)
+        except Exception as e:
+            self.logger.error(f"Error setting reasoning mode: {e}")
+            raise
+            
     async def get_disabled_tools(self, guild_id: int) -> List[str]:
         try:
             tools = DisabledTools.select().where(DisabledTools.guild_id == guild_id)
@@ -146,41 +334,105 @@ class DatabaseService:
             self.logger.error(f"Error removing enabled channel from database: {e}")
             raise
 
-    async def add_message(self, channel_id: int, role: str, content: str, image_url: Optional[str], message_id: Optional[int] = None) -> None:
+    async def add_message(self, channel_id: int, role: str, content: str, image_url: Union[str, List[str], None], message_id: Optional[int] = None, guild_id: Optional[int] = None) -> None:
+        # Inserts from every channel share commits on the write buffer's
+        # thread. This waits for the commit, so a failed write still raises
+        # here.
+        if isinstance(image_url, list):
+            image_url = IMAGE_URL_SEPARATOR.join(image_url) or None
+        await write_buffer.add({
+            "channel_id": channel_id,
+            "role": role,
+            "content": content,
+            "image_url": image_url,
+            "message_id": message_id,
+            "timestamp": datetime.now(),
+            "guild_id": guild_id,
+            "index_text": self.searchable_text(content),
+        })
+        
+    async def flush_writes(self) -> None:
+        await write_buffer.drain()
+
+    async def search_history(self, query: str, channel_ids: List[int], limit: int = 5) -> List[Dict[str, Any]]:
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return []
+        # Quote every term so user input can't inject FTS5 query syntax.
+        match = " OR ".join(f'"{term}"' for term in terms)
+        await write_buffer.drain()
+        
         try:
-            Message.create(
-                channel_id=channel_id,
-                role=role,
-                content=content,
-                image_url=image_url,
-                message_id=message_id
-            )
+            # Callers pass the channels the requester may read, rather than a
+            # guild id, so private channels never leak into server-wide
+            # results. It also covers rows indexed without a guild id.
+            condition = MessageIndex.match(match) & MessageIndex.channel_id.in_(channel_ids)
+            
+            rows = (MessageIndex
+                    .select(MessageIndex.content, MessageIndex.channel_id, Message.role, Message.timestamp)
+                    .join(Message, on=(MessageIndex.rowid == Message.id))
+                    .where(condition)
+                    .order_by(MessageIndex.bm25())
+                    .limit(limit)
+                    .dicts())
+            
+            return [
+                {
+                    "channel_id": row["channel_id"],
+                    "role": row["role"],
+                    "timestamp": row["timestamp"].strftime("%Y-%m-%d %H:%M:%S") if isinstance(row["timestamp"], datetime) else str(row["timestamp"]),
+                    "content": row["content"][:500],
+                }
+                for row in rows
+            ]
         except Exception as e:
-            self.logger.error(f"Error adding message to database: {e}")
+            self.logger.error(f"Error searching message history: {e}")
             raise
 
-    async def get_channel_history(self, channel_id: int) -> List[Dict[str, str]]:
+    async def get_channel_history(self, channel_id: int, limit: int = 0) -> List[Dict[str, str]]:
         try:
             messages = (Message
                     .select()
-                    .where(Message.channel_id == channel_id)
-                    .order_by(Message.timestamp))
+                    .where(Message.channel_id == channel_id))
+            
+            if limit > 0:
+                messages = list(messages.order_by(Message.timestamp.desc()).limit(limit))[::-1]
+            else:
+                messages = list(messages.order_by(Message.timestamp))
+
+            
+            # Only the most recent images are sent to the model, older ones
+            # are reduced to a placeholder to save vision tokens.
+            image_indices = [index for index, msg in enumerate(messages) if msg.image_url]
+            keep = self.image_cache.keep_recent
+            if keep < 0:
+                recent_images = set(image_indices)
+            else:
+                recent_images = set(image_indices[-keep:]) if keep else set()
+            
+            # Cache misses read the file in a worker thread.
+            recent_parts = await asyncio.gather(*(
+                asyncio.gather(*map(self.image_cache.image_part, messages[index].image_url.split(IMAGE_URL_SEPARATOR)))
+                for index in sorted(recent_images)
+            ))
+            parts_by_index = dict(zip(sorted(recent_images), recent_parts))
             
             formatted_messages = []
-            for msg in messages:
-                if msg.image_url:
+            for index, msg in enumerate(messages):
+                image_parts = [part for part in parts_by_index.get(index, ()) if part]
+                if image_parts:
                     formatted_message = {
                         "role": msg.role,
                         "content": [
                             {"type": "text", "text": msg.content},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": msg.image_url,
-                                },
-                            },
+                            *image_parts,
                         ],
                     }
+                elif msg.image_url:
+                    formatted_message = {
+                        "role": msg.role,
+                        "content": msg.content + "\n[An image was attached here.]"
+                    }
                 else:
                     formatted_message = {
                         "role": msg.role,
@@ -194,13 +446,21 @@ class DatabaseService:
             raise
 
     async def clear_channel_history(self, channel_id: int) -> None:
+        # Let queued rows land first, otherwise they'd be committed after
+        # the delete.
+        await write_buffer.drain()
         try:
-            query = Message.delete().where(Message.channel_id == channel_id)
-            query.execute()
+            with db.atomic():
+                MessageIndex.delete().where(MessageIndex.channel_id == channel_id).execute()
+                Message.delete().where(Message.channel_id == channel_id).execute()
         except Exception as e:
             self.logger.error(f"Error clearing channel history: {e}")
             raise
 
     def __del__(self):
         if not db.is_closed():
-            db.close()
\ No newline at end of file
+            db.close()
+
+@lru_cache(maxsize=1)
+def get_database_service() -> DatabaseService:
+    return DatabaseService()
@@ -0,0 +1,110 @@
+from decouple import config
+
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from services.vector_compression import compact_collection_suffix
+
+def use_local_embeddings() -> bool:
+    return config("EMBEDDING_BACKEND", default="remote").lower() == "local"
+
+def memory_collection_name() -> str:
+    # Local and remote models produce vectors of different sizes, and so do
+    # compacted ones, so none of them can share a collection.
+    return base_memory_collection_name() + compact_collection_suffix()
+
+def base_memory_collection_name() -> str:
+    return config("MEMORY_COLLECTION", default="memory_local" if use_local_embeddings() else "memory")
+
+def remote_memory_collection_name() -> str:
+    # Where memories embedded by the OpenAI/Ollama model live, the source for
+    # re-embedding them locally.
+    return "memory" + compact_collection_suffix()
+
+class LocalEmbeddings:
+    def __init__(self) -> None:
+        self.model_name = config("LOCAL_EMBEDDING_MODEL", default="sentence-transformers/all-MiniLM-L6-v2")
+        self.batch_size = config("LOCAL_EMBEDDING_BATCH_SIZE", default=32, cast=int)
+        self.max_delay = config("LOCAL_EMBEDDING_MAX_DELAY_MS", default=5, cast=int) / 1000
+        self.logger = logging.getLogger(__name__)
+
+        # A single worker thread owns the model; torch parallelizes inside it.
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embeddings")
+        self._tokenizer = None
+        self._model = None
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    def _load(self) -> None:
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        start = time.perf_counter()
+        self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        self._model = AutoModel.from_pretrained(self.model_name).to("cpu").eval()
+        torch.set_grad_enabled(False)
+        self.logger.info(f"Loaded local embedding model {self.model_name} in {time.perf_counter() - start:.1f}s")
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        import torch
+
+        if self._model is None:
+            self._load()
+
+        with torch.inference_mode():
+            tokens = self._tokenizer(texts, padding=True, truncation=True, max_length=512, return_tensors="pt")
+            hidden = self._model(**tokens).last_hidden_state
+            mask = tokens["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            pooled = torch.nn.functional.normalize(pooled, p=2, dim=1)
+        return pooled.tolist()
+
+    async def warmup(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._encode, ["warmup"])
+
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        # Requests arriving within a few milliseconds of each other share one
+        # forward pass.
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        return list(await asyncio.gather(*(self.embed(text) for text in texts)))
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+        if not batch:
+            return
+        if self._pending:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+
+        work = asyncio.get_running_loop().run_in_executor(self.executor, self._encode, [text for text, _ in batch])
+
+        def deliver(result: asyncio.Future) -> None:
+            for index, (_, future) in enumerate(batch):
+                if future.done():
+                    continue
+                if result.exception() is not None:
+                    future.set_exception(result.exception())
+                else:
+                    future.set_result(result.result()[index])
+
+        work.add_done_callback(deliver)
+
+@lru_cache(maxsize=1)
+def get_local_embeddings() -> LocalEmbeddings:
+    return LocalEmbeddings()
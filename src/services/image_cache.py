@@ -0,0 +1,91 @@
+from decouple import config
+from PIL import Image, ImageOps
+
+import io
+import os
+import base64
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+CACHE_PREFIX = "cache://"
+
+def _read_data_url(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return "data:image/jpeg;base64," + base64.b64encode(f.read()).decode("ascii")
+    except OSError:
+        return None
+
+class ImageCache:
+    def __init__(self, cache_dir: str = "./db/images") -> None:
+        self.cache_dir = cache_dir
+        self.max_side = config("IMAGE_MAX_SIDE", default=1024, cast=int)
+        self.quality = config("IMAGE_QUALITY", default=85, cast=int)
+        self.detail = config("IMAGE_DETAIL", default="low")
+        self.keep_recent = config("IMAGE_HISTORY_KEEP", default=2, cast=int)
+        self.logger = logging.getLogger(__name__)
+        # Encoded images of the most recent history, so every prompt doesn't
+        # read and encode them again.
+        self.data_urls: "OrderedDict[str, str]" = OrderedDict()
+        self.max_data_urls = 64
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def is_cached(image_url: str) -> bool:
+        return image_url.startswith(CACHE_PREFIX)
+
+    def _path(self, image_url: str) -> str:
+        return os.path.join(self.cache_dir, image_url[len(CACHE_PREFIX):])
+
+    def _process(self, data: bytes) -> str:
+        name = hashlib.sha256(data).hexdigest() + ".jpg"
+        path = os.path.join(self.cache_dir, name)
+        if os.path.exists(path):
+            return CACHE_PREFIX + name
+
+        with Image.open(io.BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            image.thumbnail((self.max_side, self.max_side))
+
+            tmp_path = path + ".tmp"
+            image.save(tmp_path, format="JPEG", quality=self.quality, optimize=True)
+            os.replace(tmp_path, path)
+
+        self.logger.info(f"Cached image {name}: {len(data) / 1024:.0f}KB -> {os.path.getsize(path) / 1024:.0f}KB")
+        return CACHE_PREFIX + name
+
+    async def store_bytes(self, data: bytes) -> str:
+        return await asyncio.to_thread(self._process, data)
+
+    async def data_url(self, image_url: str) -> Optional[str]:
+        url = self.data_urls.get(image_url)
+        if url is not None:
+            self.data_urls.move_to_end(image_url)
+            return url
+        url = await asyncio.to_thread(_read_data_url, self._path(image_url))
+        if url is not None:
+            self.data_urls[image_url] = url
+            if len(self.data_urls) > self.max_data_urls:
+                self.data_urls.popitem(last=False)
+        return url
+
+    async def image_part(self, image_url: str) -> Optional[Dict[str, Any]]:
+        if self.is_cached(image_url):
+            url = await self.data_url(image_url)
+            if url is None:
+                return None
+        else:
+            # Rows stored before the cache existed still hold the remote URL.
+            url = image_url
+        return {
+            "type": "image_url",
+            "image_url": {
+                "url": url,
+                "detail": self.detail,
+            },
+        }
@@ -4,101 +4,282 @@ from ollama import AsyncClient
 import chromadb
 from chromadb.config import Settings
 
+import abc
 import uuid
-from typing import List, Dict
-from decouple import config
+import time
+import asyncio
+import logging
+import numpy as np
+from typing import List, Dict, Optional, Tuple, Type
+from decouple import config, Csv
 from datetime import datetime
 
 from utils.models import ReasoningModel
+from services.embeddings import get_local_embeddings, memory_collection_name, remote_memory_collection_name, use_local_embeddings
+from services.vector_compression import VectorCompression, normalize
 
-class OpenAI:
+class MemoryBackend(abc.ABC):
     def __init__(self) -> None:
-        self.client = AsyncOpenAI(api_key=config('OPENAI_API_KEY'))
         self.chroma_client = chromadb.PersistentClient(path="./db", settings=Settings(anonymized_telemetry=False))
-        self.collection = self.chroma_client.get_or_create_collection(name="memory")
+        self.collection = self.chroma_client.get_or_create_collection(name=memory_collection_name())
+        self.local_embeddings = get_local_embeddings() if use_local_embeddings() else None
+        self.compression = VectorCompression.from_config(self.collection)
+        if self.local_embeddings is not None:
+            self._warn_hidden_memories()
+    
+    def _warn_hidden_memories(self) -> None:
+        # Local vectors can't be compared with remote ones, so switching
+        # EMBEDDING_BACKEND starts from an empty collection.
+        remote_name = remote_memory_collection_name()
+        if remote_name == self.collection.name or self.collection.count() > 0:
+            return
+        try:
+            remote_count = self.chroma_client.get_collection(name=remote_name).count()
+        except Exception:
+            return
+        if remote_count:
+            logging.getLogger(__name__).warning(
+                f"EMBEDDING_BACKEND=local uses the empty collection {self.collection.name}; the {remote_count} memories in "
+                f"{remote_name} are not visible until they are re-embedded with `python src/migrate_memory.py --reembed`"
+            )
         
-    async def retrieve_memory(self, query: str, guild_id: int) -> str:
-        response = await self.client.embeddings.create(
-            model=config('OPENAI_EMBEDDING_MODEL'),
-            input=query
-        )
+    @abc.abstractmethod
+    async def remote_embed(self, text: str) -> List[float]:
+        ...
+    
+    async def embed(self, text: str) -> List[float]:
+        if self.local_embeddings is not None:
+            embedding = await self.local_embeddings.embed(text)
+        else:
+            embedding = await self.remote_embed(text)
+        if self.compression is not None:
+            return self.compression.reduce(embedding)
+        # Ollama's /api/embeddings doesn't normalize its vectors. Distances
+        # are only comparable (and convertible to a cosine) for unit vectors.
+        return normalize(np.asarray([embedding], dtype=np.float32))[0].tolist()
+    
+    def _search(self, embedding: List[float], guild_id: int, n_results: int) -> List[Tuple[str, float]]:
+        if self.compression is not None and self.compression.index is not None:
+            return self.compression.search(embedding, guild_id, n_results)
+        n_results = min(n_results, self.collection.count())
+        if n_results == 0:
+            return []
         results = self.collection.query(
-            query_embeddings=[response.data[0].embedding],
-            n_results=1,
-            where={"guild_id": guild_id}
+            query_embeddings=[embedding],
+            n_results=n_results,
+            where={"guild_id": guild_id},
+            include=["documents", "distances"]
         )
-        if len(results['documents'][0]) < 1:
+        if not results['documents'] or not results['documents'][0]:
+            return []
+        return list(zip(results['documents'][0], results['distances'][0]))
+    
+    async def query_memories(self, query: str, guild_id: int, n_results: int = 1) -> List[Tuple[str, float]]:
+        return await asyncio.to_thread(self._search, await self.embed(query), guild_id, n_results)
+        
+    async def retrieve_memory(self, query: str, guild_id: int) -> str:
+        results = await self.query_memories(query, guild_id)
+        if not results:
             return "Memory not found."
         
-        return results['documents'][0][0]
+        return results[0][0]
     
     async def store_memory(self, memory: str, guild_id: int) -> str:
         memory = memory + "\nTIMESTAMP: " + str(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-        response = await self.client.embeddings.create(
-            model=config('OPENAI_EMBEDDING_MODEL'),
-            input=memory
-        )
+        memory_id = uuid.uuid4().hex
+        embedding = await self.embed(memory)
         self.collection.add(
-            ids=[uuid.uuid4().hex],
-            embeddings=[response.data[0].embedding],
+            ids=[memory_id],
+            embeddings=[embedding],
             documents=[memory],
             metadatas=[{"guild_id": guild_id}]
         )
+        if self.compression is not None:
+            self.compression.add(memory_id, embedding, guild_id)
         
         return "Memory stored successfully."
+
+class OpenAI(MemoryBackend):
+    # Structured outputs reject maxLength, so the reasoning length is only
+    # asked for in the prompt and truncated after parsing.
+    schema_length_limit = False
+    
+    def __init__(self) -> None:
+        super().__init__()
+        self.client = AsyncOpenAI(api_key=config('OPENAI_API_KEY'))
+        
+    async def remote_embed(self, text: str) -> List[float]:
+        response = await self.client.embeddings.create(
+            model=config('OPENAI_EMBEDDING_MODEL'),
+            input=text
+        )
+        return response.data[0].embedding
         
-    async def generate_response(self, messages: List[Dict[str, str]]) -> ReasoningModel:
+    async def generate_response(self, messages: List[Dict[str, str]], model: Optional[str] = None, response_model: Type[ReasoningModel] = ReasoningModel) -> ReasoningModel:
         response = await self.client.beta.chat.completions.parse(
-            model=config('OPENAI_MODEL'),
+            model=model or config('OPENAI_MODEL'),
             messages=messages,
-            response_format=ReasoningModel
+            response_format=response_model
         )
         
-        return response.choices[0].message.parsed
+        parsed = response.choices[0].message.parsed
+        if parsed is not None and response.usage is not None:
+            parsed._usage = {
+                "prompt_tokens": response.usage.prompt_tokens,
+                "completion_tokens": response.usage.completion_tokens,
+            }
+        return parsed
+    
+class ContextSizer:
+    def __init__(self) -> None:
+        self.max_ctx = config("OLLAMA_NUM_CTX", default=8192, cast=int)
+        self.buckets = sorted(
+            bucket for bucket in config("OLLAMA_NUM_CTX_BUCKETS", default="4096,8192,16384,32768", cast=Csv(int))
+            if bucket < self.max_ctx
+        ) + [self.max_ctx]
+        self.reserve = config("OLLAMA_NUM_PREDICT_RESERVE", default=4096, cast=int)
+        self.shrink_after = config("OLLAMA_NUM_CTX_SHRINK_AFTER", default=5, cast=int)
+        self.chars_per_token = 4.0
+        self.current: Optional[int] = None
+        self._smaller_streak = 0
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def count_chars(messages: List[Dict[str, str]]) -> int:
+        return sum(len(str(message.get("content", ""))) for message in messages)
+
+    def estimate_tokens(self, messages: List[Dict[str, str]]) -> int:
+        return int(self.count_chars(messages) / self.chars_per_token) + 4 * len(messages)
+
+    def choose(self, messages: List[Dict[str, str]]) -> int:
+        needed = self.estimate_tokens(messages) + self.reserve
+        bucket = next((b for b in self.buckets if b >= needed), self.max_ctx)
+
+        if needed > self.max_ctx:
+            self.logger.warning(f"Prompt needs ~{needed} tokens but OLLAMA_NUM_CTX is {self.max_ctx}; it will be truncated")
+
+        if self.current is None or bucket > self.current:
+            self._smaller_streak = 0
+            self.current = bucket
+        elif bucket < self.current:
+            # Shrinking forces Ollama to reload the model, so only do it once
+            # smaller prompts have been the norm for a while.
+            self._smaller_streak += 1
+            if self._smaller_streak >= self.shrink_after:
+                self._smaller_streak = 0
+                self.current = bucket
+        else:
+            self._smaller_streak = 0
+
+        return self.current
+
+    def calibrate(self, messages: List[Dict[str, str]], prompt_tokens: Optional[int]) -> None:
+        if not prompt_tokens:
+            return
+        # Ollama only counts the tokens it evaluated. When the start of the
+        # prompt was still in its cache the count covers just the new part,
+        # which would make every character look like far more than a token.
+        if prompt_tokens < self.estimate_tokens(messages) / 2:
+            return
+        observed = self.count_chars(messages) / prompt_tokens
+        if observed > 0:
+            self.chars_per_token = 0.8 * self.chars_per_token + 0.2 * observed
+
+class Ollama(MemoryBackend):
+    schema_length_limit = True
     
-class Ollama:
     def __init__(self) -> None:
+        super().__init__()
         self.client = AsyncClient(host=config('OLLAMA_HOST'))
-        self.chroma_client = chromadb.PersistentClient(path="./db", settings=Settings(anonymized_telemetry=False))
-        self.collection = self.chroma_client.get_or_create_collection(name="memory")
-        
-    async def retrieve_memory(self, query: str, guild_id: int) -> str:
-        response = await self.client.embeddings(
-            model=config('OLLAMA_EMBEDDING_MODEL'),
-            prompt=query
-        )
-        results = self.collection.query(
-            query_embeddings=[response.embedding],
-            n_results=1,
-            where={"guild_id": guild_id}
-        )
-        if not results['documents'] or not results['documents'][0]:
-            return "Memory not found."
-        return results['documents'][0][0]['answer']
+        self.keep_alive = config("OLLAMA_KEEP_ALIVE", default="30m")
+        self.warmup_interval = config("OLLAMA_WARMUP_INTERVAL", default=240, cast=int)
+        # One per model, each has its own tokenizer and loaded context size.
+        self.ctx_sizers: Dict[str, ContextSizer] = {}
+        self.logger = logging.getLogger(__name__)
+        self._warmup_task: Optional[asyncio.Task] = None
+
+    def ctx_sizer(self, model: str) -> ContextSizer:
+        if model not in self.ctx_sizers:
+            self.ctx_sizers[model] = ContextSizer()
+        return self.ctx_sizers[model]
+
+    def start_warmup(self) -> None:
+        if self.warmup_interval <= 0 or self._warmup_task is not None:
+            return
+        self._warmup_task = asyncio.create_task(self._warmup_loop())
+
+    def stop_warmup(self) -> None:
+        if self._warmup_task is not None:
+            self._warmup_task.cancel()
+            self._warmup_task = None
+
+    async def _warmup_loop(self) -> None:
+        while True:
+            await self.warmup()
+            await asyncio.sleep(self.warmup_interval)
+
+    def warmup_models(self) -> List[str]:
+        # The router's fast model is kept warm too, it answers the short
+        # follow-up turns.
+        fast_model = config("OLLAMA_FAST_MODEL", default="")
+        return [config('OLLAMA_MODEL')] + ([fast_model] if fast_model else [])
+
+    async def warmup(self) -> None:
+        for model in self.warmup_models():
+            await self.warmup_model(model)
+
+    async def warmup_model(self, model: str) -> None:
+        # An empty prompt loads the model (if needed) and refreshes keep_alive
+        # without generating anything. Reuse the current num_ctx so the ping
+        # does not itself trigger a reload. On a cold start load the smallest
+        # bucket, which is what most first prompts need, instead of Ollama's
+        # default context.
+        ctx_sizer = self.ctx_sizer(model)
+        if ctx_sizer.current is None:
+            ctx_sizer.current = ctx_sizer.buckets[0]
+        try:
+            start = time.perf_counter()
+            response = await self.client.generate(
+                model=model,
+                prompt="",
+                keep_alive=self.keep_alive,
+                options={"num_ctx": ctx_sizer.current}
+            )
+            load_ms = (response.load_duration or 0) / 1e6
+            if load_ms > 100:
+                self.logger.info(f"Ollama warm-up loaded {model} with num_ctx={ctx_sizer.current} in {load_ms:.0f}ms (total {(time.perf_counter() - start) * 1000:.0f}ms)")
+        except Exception as e:
+            self.logger.warning(f"Ollama warm-up of {model} failed: {e}")
         
-    async def store_memory(self, memory: str, guild_id: int) -> str:
-        memory = memory + "\nTIMESTAMP: " + str(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    async def remote_embed(self, text: str) -> List[float]:
         response = await self.client.embeddings(
             model=config('OLLAMA_EMBEDDING_MODEL'),
-            prompt=memory
+            prompt=text
         )
-        self.collection.add(
-            ids=[uuid.uuid4().hex],
-            embeddings=[response.embedding],
-            documents=[memory],
-            metadatas=[{"guild_id": guild_id}]
-        )
-        
-        return "Memory stored successfully."
+        return response.embedding
     
-    async def generate_response(self, messages: List[Dict[str, str]]) -> ReasoningModel:
+    async def generate_response(self, messages: List[Dict[str, str]], model: Optional[str] = None, response_model: Type[ReasoningModel] = ReasoningModel) -> ReasoningModel:
+        model = model or config('OLLAMA_MODEL')
+        ctx_sizer = self.ctx_sizer(model)
+        num_ctx = ctx_sizer.choose(messages)
         response = await self.client.chat(
-            model=config('OLLAMA_MODEL'),
+            model=model,
             messages=messages,
-            format=ReasoningModel.model_json_schema(),
+            format=response_model.model_json_schema(),
+            keep_alive=self.keep_alive,
             options={
-                "num_ctx": config("OLLAMA_NUM_CTX", default=8192, cast=int),
+                "num_ctx": num_ctx,
             }
         )
+        ctx_sizer.calibrate(messages, response.prompt_eval_count)
+
+        load_ms = (response.load_duration or 0) / 1e6
+        log = self.logger.info if load_ms > 100 else self.logger.debug
+        log(f"Ollama num_ctx={num_ctx} prompt_tokens={response.prompt_eval_count} load={load_ms:.0f}ms")
 
-        return ReasoningModel.model_validate_json(response.message.content)
\ No newline at end of file
+        parsed = response_model.model_validate_json(response.message.content)
+        parsed._usage = {
+            "prompt_tokens": response.prompt_eval_count or 0,
+            "completion_tokens": response.eval_count or 0,
+        }
+        return parsed
\ No newline at end of file
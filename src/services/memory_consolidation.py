@@ -0,0 +1,178 @@
+from decouple import config
+
+import time
+import random
+import asyncio
+import logging
+import numpy as np
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+EARLIER_HEADER = "\nEarlier versions:\n"
+
+class MemoryConsolidator:
+    def __init__(self, collection: Any) -> None:
+        self.collection = collection
+        self.threshold = config("MEMORY_DEDUP_THRESHOLD", default=0.95, cast=float)
+        self.block_size = config("MEMORY_DEDUP_BLOCK_SIZE", default=1024, cast=int)
+        self.interval = config("MEMORY_CONSOLIDATE_INTERVAL", default=21600, cast=int)
+        self.logger = logging.getLogger(__name__)
+        self.last_report: Dict[str, Any] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._loop())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.consolidate)
+            except Exception as e:
+                self.logger.error(f"Memory consolidation failed: {e}", exc_info=True)
+
+    def find_clusters(self, embeddings: np.ndarray, order: Optional[List[int]] = None) -> List[List[int]]:
+        """Group near-duplicates around a representative.
+
+        Memories are visited in ``order`` (most important first) and each one
+        that isn't taken yet claims its unclaimed neighbours. Every member is
+        similar to the representative itself, so a chain of small changes
+        (A~B, B~C, but not A~C) isn't collapsed into one memory. The
+        representative is the first member of each cluster."""
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        normalized = embeddings / np.clip(norms, 1e-12, None)
+        count = len(normalized)
+
+        neighbours: Dict[int, List[int]] = defaultdict(list)
+        for start in range(0, count, self.block_size):
+            block = normalized[start:start + self.block_size]
+            mask = block @ normalized.T >= self.threshold
+            for i, j in zip(*np.nonzero(mask)):
+                if start + int(i) != int(j):
+                    neighbours[start + int(i)].append(int(j))
+
+        taken = set()
+        clusters = []
+        for i in order if order is not None else range(count):
+            if i in taken or i not in neighbours:
+                continue
+            members = [i] + [j for j in neighbours[i] if j not in taken]
+            taken.update(members)
+            if len(members) > 1:
+                clusters.append(members)
+        return clusters
+
+    @staticmethod
+    def _split(document: str) -> Tuple[str, List[str], str]:
+        rest, separator, timestamp = document.rpartition("\nTIMESTAMP: ")
+        if not separator:
+            rest, timestamp = document, ""
+        body, _, earlier = rest.partition(EARLIER_HEADER)
+        return body, [line[2:] for line in earlier.split("\n") if line.startswith("- ")], timestamp
+
+    @classmethod
+    def _timestamp(cls, document: str) -> str:
+        return cls._split(document)[2]
+
+    @classmethod
+    def merge_documents(cls, kept: str, dropped: List[str]) -> str:
+        """Fold the text of the dropped memories into the kept one, so a
+        detail only some of the duplicates mention isn't lost."""
+        body, earlier, timestamp = cls._split(kept)
+        for document in dropped:
+            other_body, other_earlier, other_timestamp = cls._split(document)
+            versions = [f"{other_body} ({other_timestamp})" if other_timestamp else other_body] + other_earlier
+            for version, text in zip(versions, [other_body] + other_earlier):
+                if text.strip() and text not in body and not any(text in entry for entry in earlier):
+                    earlier.append(version)
+
+        document = body
+        if earlier:
+            document += EARLIER_HEADER + "\n".join(f"- {version}" for version in earlier)
+        if timestamp:
+            document += "\nTIMESTAMP: " + timestamp
+        return document
+
+    def _consolidate_guild(self, ids: List[str], embeddings: np.ndarray, documents: List[str], metadatas: List[Dict[str, Any]]) -> int:
+        # The newest memory represents its cluster; it is the most up to date
+        # version of whatever the duplicates describe.
+        order = sorted(range(len(ids)), key=lambda i: (self._timestamp(documents[i]), len(documents[i])), reverse=True)
+        removed = 0
+        for cluster in self.find_clusters(embeddings, order):
+            keep, drop = cluster[0], cluster[1:]
+
+            metadata = dict(metadatas[keep])
+            metadata["merged_count"] = sum(metadatas[i].get("merged_count", 1) for i in cluster)
+            # Pass the embedding along, otherwise Chroma re-embeds the new
+            # document with its default model.
+            self.collection.update(
+                ids=[ids[keep]],
+                embeddings=[embeddings[keep].tolist()],
+                documents=[self.merge_documents(documents[keep], [documents[i] for i in drop])],
+                metadatas=[metadata]
+            )
+            self.collection.delete(ids=[ids[i] for i in drop])
+            removed += len(drop)
+        return removed
+
+    def _probe_latency(self, samples: List[Any], guild_ids: List[Any]) -> float:
+        if not samples:
+            return 0.0
+        start = time.perf_counter()
+        for embedding, guild_id in zip(samples, guild_ids):
+            self.collection.query(
+                query_embeddings=[embedding.tolist()],
+                n_results=1,
+                where={"guild_id": guild_id} if guild_id is not None else None
+            )
+        return (time.perf_counter() - start) / len(samples)
+
+    def consolidate(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        data = self.collection.get(include=["embeddings", "documents", "metadatas"])
+        ids = data["ids"]
+        if not ids:
+            return {}
+        embeddings = np.asarray(data["embeddings"], dtype=np.float32)
+
+        guilds = defaultdict(list)
+        for index, metadata in enumerate(data["metadatas"]):
+            guilds[(metadata or {}).get("guild_id")].append(index)
+
+        sample = random.sample(range(len(ids)), min(20, len(ids)))
+        probe = ([embeddings[i] for i in sample], [(data["metadatas"][i] or {}).get("guild_id") for i in sample])
+        latency_before = self._probe_latency(*probe)
+
+        removed = 0
+        for indices in guilds.values():
+            if len(indices) < 2:
+                continue
+            removed += self._consolidate_guild(
+                [ids[i] for i in indices],
+                embeddings[indices],
+                [data["documents"][i] for i in indices],
+                [data["metadatas"][i] or {} for i in indices]
+            )
+
+        latency_after = self._probe_latency(*probe)
+        self.last_report = {
+            "before": len(ids),
+            "after": len(ids) - removed,
+            "removed": removed,
+            "shrink": round(removed / len(ids), 3),
+            "query_ms_before": round(latency_before * 1000, 2),
+            "query_ms_after": round(latency_after * 1000, 2),
+            "took_s": round(time.perf_counter() - start, 2),
+        }
+        self.logger.info(f"Memory consolidation: {self.last_report}")
+        return self.last_report
+
+    def stats(self) -> Dict[str, Any]:
+        return self.last_report or {"runs": 0}
@@ -0,0 +1,71 @@
+from decouple import config
+
+import time
+import logging
+from typing import Any, Dict, List
+
+from utils.metrics import LatencyStats
+
+class MemoryPrefetcher:
+    def __init__(self, backend: Any) -> None:
+        self.backend = backend
+        self.enabled = config("MEMORY_PREFETCH", default=False, cast=bool)
+        self.top_k = config("MEMORY_PREFETCH_TOP_K", default=3, cast=int)
+        self.min_score = config("MEMORY_PREFETCH_MIN_SCORE", default=0.5, cast=float)
+        self.min_chars = config("MEMORY_PREFETCH_MIN_CHARS", default=8, cast=int)
+        self.logger = logging.getLogger(__name__)
+
+        self.latency = LatencyStats()
+        self.turns = 0
+        self.injected = 0
+        self.retrieved_anyway = 0
+        self.retrieved_without = 0
+        self.failed = 0
+
+    @staticmethod
+    def score(distance: float) -> float:
+        # Embeddings are normalized before they are stored or queried and
+        # Chroma defaults to squared L2, which makes this the cosine similarity.
+        return 1 - distance / 2
+
+    async def prefetch(self, query: str, guild_id: int) -> List[str]:
+        if not self.enabled or len(query.strip()) < self.min_chars:
+            return []
+
+        start = time.perf_counter()
+        try:
+            results = await self.backend.query_memories(query, guild_id, self.top_k)
+        except Exception as e:
+            self.failed += 1
+            self.logger.warning(f"Memory prefetch failed: {e}")
+            return []
+        self.latency.record(time.perf_counter() - start)
+        return [document for document, distance in results if self.score(distance) >= self.min_score]
+
+    def record_turn(self, memories: List[str], called_retrieve: bool) -> None:
+        if not self.enabled:
+            return
+        self.turns += 1
+        if memories:
+            self.injected += 1
+            if called_retrieve:
+                self.retrieved_anyway += 1
+        elif called_retrieve:
+            self.retrieved_without += 1
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {"enabled": False}
+        # A hit is a turn where prefetched memories saved the model its own
+        # memory_retrieve round trip.
+        hits = self.injected - self.retrieved_anyway
+        return {
+            "turns": self.turns,
+            "injected": self.injected,
+            "hits": hits,
+            "hit_rate": round(hits / self.injected, 3) if self.injected else 0,
+            "retrieved_anyway": self.retrieved_anyway,
+            "retrieved_without": self.retrieved_without,
+            "failed": self.failed,
+            **{f"latency_{key}": value for key, value in self.latency.summary().items()},
+        }
@@ -0,0 +1,87 @@
+from decouple import config
+
+import json
+import time
+import logging
+from typing import Any, Dict, List, Optional, Type
+
+from utils.models import ReasoningModel
+from utils.metrics import LatencyStats
+
+class TierStats:
+    def __init__(self, model: Optional[str]) -> None:
+        self.model = model
+        self.latency = LatencyStats()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def record(self, seconds: float, response: ReasoningModel) -> None:
+        self.latency.record(seconds)
+        self.prompt_tokens += response._usage.get("prompt_tokens", 0)
+        self.completion_tokens += response._usage.get("completion_tokens", 0)
+
+    def summary(self) -> Dict[str, Any]:
+        calls = self.latency.count
+        return {
+            "model": self.model,
+            **self.latency.summary(),
+            "avg_prompt_tokens": round(self.prompt_tokens / calls) if calls else 0,
+            "avg_completion_tokens": round(self.completion_tokens / calls) if calls else 0,
+        }
+
+class ModelRouter:
+    def __init__(self, backend: Any, backend_type: str) -> None:
+        self.backend = backend
+        prefix = "OPENAI" if backend_type == "openai" else "OLLAMA"
+        self.large_model = config(f"{prefix}_MODEL")
+        self.fast_model = config(f"{prefix}_FAST_MODEL", default="") or None
+        self.max_return_chars = config("FAST_MODEL_MAX_RETURN_CHARS", default=1500, cast=int)
+        self.logger = logging.getLogger(__name__)
+
+        self.tiers = {
+            "large": TierStats(self.large_model),
+            "fast": TierStats(self.fast_model),
+        }
+        self.fallbacks = 0
+
+    def choose_tier(self, messages: List[Dict[str, Any]]) -> str:
+        if self.fast_model is None:
+            return "large"
+
+        # Only follow-ups that relay short, successful tool results go to the
+        # fast model. First turns, errors and images need the large one.
+        content = messages[-1].get("content")
+        if messages[-1].get("role") != "user" or not isinstance(content, str) or len(content) > self.max_return_chars:
+            return "large"
+        try:
+            returns = json.loads(content)
+        except ValueError:
+            return "large"
+        if not isinstance(returns, list):
+            returns = [returns]
+        if all(isinstance(item, dict) and item.get("message_type") == "tool_return" for item in returns):
+            return "fast"
+        return "large"
+
+    async def _call(self, tier: str, messages: List[Dict[str, Any]], response_model: Type[ReasoningModel]) -> ReasoningModel:
+        start = time.perf_counter()
+        response = await self.backend.generate_response(messages, model=self.tiers[tier].model, response_model=response_model)
+        if response is None:
+            raise ValueError(f"{tier} model returned no parsable response")
+        self.tiers[tier].record(time.perf_counter() - start, response)
+        return response
+
+    async def generate_response(self, messages: List[Dict[str, Any]], response_model: Type[ReasoningModel] = ReasoningModel) -> ReasoningModel:
+        if self.choose_tier(messages) == "fast":
+            try:
+                return await self._call("fast", messages, response_model)
+            except Exception as e:
+                self.fallbacks += 1
+                self.logger.warning(f"Fast model {self.fast_model} failed, falling back to {self.large_model}: {e}")
+        return await self._call("large", messages, response_model)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {"fallbacks": self.fallbacks}
+        for tier, tier_stats in self.tiers.items():
+            stats.update({f"{tier}_{key}": value for key, value in tier_stats.summary().items()})
+        return stats
\ No newline at end of file
@@ -0,0 +1,190 @@
+from decouple import config
+
+import os
+import logging
+import threading
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+
+REDUCTIONS = ("truncate", "pca")
+QUANTIZATIONS = ("none", "int8", "binary")
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+def compact_collection_suffix() -> str:
+    dim = config("MEMORY_VECTOR_DIM", default=0, cast=int)
+    if dim <= 0:
+        return ""
+    return f"_{config('MEMORY_VECTOR_REDUCTION', default='truncate')}{dim}"
+
+class VectorReducer:
+    def __init__(self, dim: int, method: str = "truncate", path: Optional[str] = None) -> None:
+        if method not in REDUCTIONS:
+            raise ValueError(f"Unknown MEMORY_VECTOR_REDUCTION {method!r}, expected one of {REDUCTIONS}")
+        self.dim = dim
+        self.method = method
+        self.path = path
+        self.mean: Optional[np.ndarray] = None
+        self.components: Optional[np.ndarray] = None
+        if method == "pca" and path and os.path.exists(path):
+            with np.load(path) as data:
+                self.mean, self.components = data["mean"], data["components"]
+
+    @property
+    def fitted(self) -> bool:
+        return self.method == "truncate" or self.components is not None
+
+    def fit(self, vectors: np.ndarray) -> None:
+        if self.method != "pca":
+            return
+        if len(vectors) < self.dim:
+            raise ValueError(f"PCA to {self.dim} dimensions needs at least {self.dim} vectors, got {len(vectors)}")
+        vectors = normalize(np.asarray(vectors, dtype=np.float32))
+        self.mean = vectors.mean(axis=0)
+        _, _, vt = np.linalg.svd(vectors - self.mean, full_matrices=False)
+        self.components = vt[:self.dim].astype(np.float32)
+        if self.path:
+            np.savez(self.path, mean=self.mean, components=self.components)
+
+    def reduce(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = normalize(np.asarray(vectors, dtype=np.float32))
+        if self.method == "truncate":
+            # Matryoshka-trained models (e.g. text-embedding-3) keep most of
+            # their quality in the leading dimensions.
+            return normalize(vectors[:, :self.dim])
+        if self.components is None:
+            raise RuntimeError(f"No PCA fitted at {self.path}, run `python src/migrate_memory.py` first")
+        return normalize((vectors - self.mean) @ self.components.T)
+
+class QuantizedIndex:
+    def __init__(self, kind: str, rerank_factor: int = 4) -> None:
+        if kind not in QUANTIZATIONS[1:]:
+            raise ValueError(f"Unknown MEMORY_VECTOR_QUANTIZATION {kind!r}, expected one of {QUANTIZATIONS}")
+        self.kind = kind
+        self.rerank_factor = rerank_factor
+        self.ids: List[str] = []
+        self.guild_ids = np.zeros(0, dtype=np.int64)
+        self.codes: Optional[np.ndarray] = None
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        if self.kind == "binary":
+            return np.packbits(vectors > 0, axis=1)
+        # Unit vectors only have components in [-1, 1], so one fixed scale
+        # works for every vector.
+        return np.clip(np.round(vectors * 127), -127, 127).astype(np.int8)
+
+    def add(self, ids: List[str], vectors: np.ndarray, guild_ids: List[Any]) -> None:
+        codes = self.encode(np.asarray(vectors, dtype=np.float32))
+        self.codes = codes if self.codes is None else np.concatenate([self.codes, codes])
+        self.ids.extend(ids)
+        self.guild_ids = np.concatenate([self.guild_ids, np.asarray([g if g is not None else -1 for g in guild_ids], dtype=np.int64)])
+
+    def remove(self, ids: List[str]) -> None:
+        drop = set(ids)
+        keep = [i for i, id_ in enumerate(self.ids) if id_ not in drop]
+        self.ids = [self.ids[i] for i in keep]
+        self.guild_ids = self.guild_ids[keep]
+        self.codes = self.codes[keep] if self.codes is not None else None
+
+    def nbytes(self) -> int:
+        return 0 if self.codes is None else self.codes.nbytes
+
+    def candidates(self, query: np.ndarray, guild_id: int, count: int) -> List[str]:
+        if self.codes is None or not self.ids:
+            return []
+        rows = np.nonzero(self.guild_ids == guild_id)[0]
+        if len(rows) == 0:
+            return []
+        codes = self.codes[rows]
+        if self.kind == "binary":
+            query_bits = np.packbits(query > 0)
+            if hasattr(np, "bitwise_count"):
+                scores = -np.bitwise_count(codes ^ query_bits).sum(axis=1, dtype=np.int32)
+            else:
+                scores = -np.unpackbits(codes ^ query_bits, axis=1).sum(axis=1, dtype=np.int32)
+        else:
+            scores = codes.astype(np.float32) @ query
+        count = min(count, len(rows))
+        top = np.argpartition(-scores, count - 1)[:count]
+        return [self.ids[rows[i]] for i in top]
+
+class VectorCompression:
+    """Stores memories as reduced vectors and optionally searches a quantized
+    copy of them first, re-ranking the candidates with the float vectors."""
+
+    def __init__(self, collection: Any, dim: int, reduction: str, quantization: str, rerank_factor: int, pca_path: Optional[str] = None) -> None:
+        self.collection = collection
+        self.reducer = VectorReducer(dim, reduction, pca_path)
+        self.index = QuantizedIndex(quantization, rerank_factor) if quantization != "none" else None
+        self.logger = logging.getLogger(__name__)
+        self._loaded = False
+        # Searches run in a worker thread while stores happen on the loop.
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, collection: Any, db_path: str = "./db") -> Optional["VectorCompression"]:
+        dim = config("MEMORY_VECTOR_DIM", default=0, cast=int)
+        if dim <= 0:
+            return None
+        return cls(
+            collection,
+            dim,
+            config("MEMORY_VECTOR_REDUCTION", default="truncate"),
+            config("MEMORY_VECTOR_QUANTIZATION", default="none"),
+            config("MEMORY_RERANK_FACTOR", default=4, cast=int),
+            os.path.join(db_path, f"{collection.name}.pca.npz")
+        )
+
+    def reduce(self, embedding: List[float]) -> List[float]:
+        return self.reducer.reduce(np.asarray([embedding]))[0].tolist()
+
+    def _load_index(self) -> None:
+        # Chroma is the store of record; the quantized codes are rebuilt from
+        # it once per process and kept in sync by add().
+        data = self.collection.get(include=["embeddings", "metadatas"])
+        if data["ids"]:
+            self.index.add(
+                data["ids"],
+                np.asarray(data["embeddings"], dtype=np.float32),
+                [(metadata or {}).get("guild_id") for metadata in data["metadatas"]]
+            )
+        self._loaded = True
+        self.logger.info(f"Loaded {len(self.index.ids)} memories into the {self.index.kind} index ({self.index.nbytes() / 1024:.0f}KB)")
+
+    def add(self, id_: str, embedding: List[float], guild_id: int) -> None:
+        with self._lock:
+            if self.index is not None and self._loaded:
+                self.index.add([id_], np.asarray([embedding], dtype=np.float32), [guild_id])
+
+    def search(self, embedding: List[float], guild_id: int, n_results: int) -> List[Tuple[str, float]]:
+        query = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            if not self._loaded:
+                self._load_index()
+            candidates = self.index.candidates(query, guild_id, n_results * self.index.rerank_factor)
+        if not candidates:
+            return []
+
+        data = self.collection.get(ids=candidates, include=["embeddings", "documents"])
+        missing = set(candidates) - set(data["ids"])
+        if missing:
+            # Deleted behind our back, e.g. by memory consolidation.
+            with self._lock:
+                self.index.remove(list(missing))
+        if not data["ids"]:
+            return []
+
+        similarity = np.asarray(data["embeddings"], dtype=np.float32) @ query
+        order = np.argsort(-similarity)[:n_results]
+        # Report squared L2 like Chroma does for unit vectors.
+        return [(data["documents"][i], float(2 - 2 * similarity[i])) for i in order]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "dim": self.reducer.dim,
+            "reduction": self.reducer.method,
+            "quantization": self.index.kind if self.index else "none",
+            "index_kb": round(self.index.nbytes() / 1024, 1) if self.index else 0,
+        }
@@ -0,0 +1,136 @@
+from decouple import config
+from scipy.io import wavfile
+from scipy.signal import resample_poly
+
+try:
+    import soundfile as sf
+except ImportError:
+    sf = None
+
+import io
+import math
+import time
+import asyncio
+import logging
+import numpy as np
+from dataclasses import dataclass
+from typing import Any, Dict, Union
+
+import torch
+
+SAMPLE_RATE = 22050
+OPUS_SAMPLE_RATE = 48000
+
+@dataclass
+class EncodedAudio:
+    data: bytes
+    filename: str
+    raw_size: int
+    encode_seconds: float
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+class AudioEncoder:
+    EXTENSIONS = {"opus": "ogg", "flac": "flac", "wav": "wav"}
+
+    def __init__(self) -> None:
+        self.format = config("VOICE_AUDIO_FORMAT", default="opus").lower()
+        if self.format not in self.EXTENSIONS:
+            raise ValueError(f"Invalid VOICE_AUDIO_FORMAT: {self.format}")
+        self.block_frames = config("VOICE_AUDIO_BLOCK_FRAMES", default=16384, cast=int)
+        self.logger = logging.getLogger(__name__)
+
+        self.encoded_count = 0
+        self.raw_bytes = 0
+        self.encoded_bytes = 0
+        self.upload_bytes = 0
+        self.upload_seconds = 0.0
+
+    @staticmethod
+    def float32_wav_size(samples: int) -> int:
+        return samples * 4 + 44
+
+    async def encode(self, audio: Union[torch.Tensor, np.ndarray]) -> EncodedAudio:
+        if isinstance(audio, torch.Tensor):
+            audio = audio.cpu().numpy()
+        return await asyncio.to_thread(self._encode, audio)
+
+    def _encode(self, audio: np.ndarray) -> EncodedAudio:
+        start = time.perf_counter()
+        audio = np.clip(np.asarray(audio, dtype=np.float32).reshape(-1), -1.0, 1.0)
+
+        fmt = self.format
+        if fmt != "wav" and sf is None:
+            self.logger.warning(f"soundfile is not installed, falling back to 16-bit WAV instead of {fmt}")
+            fmt = "wav"
+
+        try:
+            data = self._write(audio, fmt)
+        except Exception as e:
+            if fmt == "wav":
+                raise
+            # Older libsndfile builds lack Opus support.
+            self.logger.warning(f"Failed to encode audio as {fmt}, falling back to 16-bit WAV: {e}")
+            fmt = "wav"
+            data = self._write(audio, fmt)
+
+        encoded = EncodedAudio(
+            data=data,
+            filename=f"audio.{self.EXTENSIONS[fmt]}",
+            raw_size=self.float32_wav_size(len(audio)),
+            encode_seconds=time.perf_counter() - start
+        )
+        self.encoded_count += 1
+        self.raw_bytes += encoded.raw_size
+        self.encoded_bytes += encoded.size
+        return encoded
+
+    def _write(self, audio: np.ndarray, fmt: str) -> bytes:
+        buffer = io.BytesIO()
+
+        if fmt == "wav" and sf is None:
+            wavfile.write(buffer, SAMPLE_RATE, (audio * 32767).astype(np.int16))
+            return buffer.getvalue()
+
+        if fmt == "opus":
+            # Opus only supports 8/12/16/24/48 kHz input.
+            gcd = math.gcd(OPUS_SAMPLE_RATE, SAMPLE_RATE)
+            audio = resample_poly(audio, OPUS_SAMPLE_RATE // gcd, SAMPLE_RATE // gcd).astype(np.float32)
+            params = {"samplerate": OPUS_SAMPLE_RATE, "format": "OGG", "subtype": "OPUS"}
+        elif fmt == "flac":
+            params = {"samplerate": SAMPLE_RATE, "format": "FLAC", "subtype": "PCM_16"}
+        else:
+            params = {"samplerate": SAMPLE_RATE, "format": "WAV", "subtype": "PCM_16"}
+
+        with sf.SoundFile(buffer, "w", channels=1, **params) as f:
+            for offset in range(0, len(audio), self.block_frames):
+                f.write(audio[offset:offset + self.block_frames])
+
+        return buffer.getvalue()
+
+    def record_upload(self, encoded: EncodedAudio, seconds: float) -> None:
+        self.upload_bytes += encoded.size
+        self.upload_seconds += seconds
+
+        saved = encoded.raw_size - encoded.size
+        throughput = self.upload_bytes / self.upload_seconds if self.upload_seconds else 0
+        saved_ms = saved / throughput * 1000 if throughput else 0
+        self.logger.info(
+            f"Uploaded {encoded.filename}: {encoded.size / 1024:.0f}KB instead of {encoded.raw_size / 1024:.0f}KB "
+            f"({saved / encoded.raw_size:.0%} smaller), encoded in {encoded.encode_seconds * 1000:.0f}ms, "
+            f"uploaded in {seconds * 1000:.0f}ms (~{saved_ms:.0f}ms saved)"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        throughput = self.upload_bytes / self.upload_seconds if self.upload_seconds else 0
+        saved = self.raw_bytes - self.encoded_bytes
+        return {
+            "format": self.format,
+            "encoded": self.encoded_count,
+            "raw_bytes": self.raw_bytes,
+            "encoded_bytes": self.encoded_bytes,
+            "saved_bytes": saved,
+            "saved_upload_seconds": round(saved / throughput, 2) if throughput else 0.0,
+        }
@@ -2,26 +2,37 @@ import discord
 from discord.ext import commands
 
 from utils.voice_utils import VoiceUtils
+from utils.audio_utils import AudioEncoder, EncodedAudio
+from utils.tts_cache import TTSCache
+from utils.voice_stream import VoiceStreamer
+from utils.send_queue import OutboundQueue, OutboundMessage
+from utils.message_cache import MessageCache
 from utils.img_utils import ImgOpenAI, Diffusers
-from utils.models import ReasoningModel
+from utils.models import ReasoningModel, BaseToolArgs
 from utils.discord_model import ButtonView
-from services.infer import OpenAI, Ollama
-from services.database import DatabaseService
+from services.infer import MemoryBackend, OpenAI, Ollama
+from services.database import get_database_service
 
-from typing import Any, Optional, Union
+from typing import Any, List, Optional, Tuple
 import json
+import asyncio
 import io
-import numpy as np
-from scipy.io import wavfile
+import time
 import random
-import torch
 import logging
 import aiohttp
 
+ORDERED_TOOLS = {"send_message", "send_voice_message"}
+
 class DiscordUtils:
-    def __init__(self, bot: commands.Bot):      
+    def __init__(self, bot: commands.Bot, client: Optional[MemoryBackend] = None):      
         self.voice_client = VoiceUtils()
-        self.db = DatabaseService()
+        self.audio_encoder = AudioEncoder()
+        self.tts_cache = TTSCache()
+        self.voice_streamer = VoiceStreamer(self.synthesize_sentence)
+        self.message_cache = MessageCache()
+        self.outbound = OutboundQueue(on_sent=self.message_cache.remember)
+        self.db = get_database_service()
         self.bot = bot
         if self.bot.backend == 'openai':
             self.img = ImgOpenAI()
@@ -29,7 +40,11 @@ class DiscordUtils:
             self.img = Diffusers()
             
         self.logger = logging.getLogger(__name__)
-        self._get_client()
+        # Share the cog's backend so memories stored here are visible to its
+        # prefetcher and quantized index right away.
+        self.client = client
+        if self.client is None:
+            self._get_client()
         
     def _get_client(self):
         if self.bot.backend == 'openai':
@@ -39,37 +54,69 @@ class DiscordUtils:
         else:
             raise ValueError("Invalid backend type.")
             
-    async def upload_audio(self, message: discord.Message, audio: Union[torch.Tensor, np.ndarray], transcription: str, reasoning: str) -> None:
-        if isinstance(audio, torch.Tensor):
-            audio = audio.cpu().numpy()
-        else:
-            audio = audio
+    async def synthesize_voice(self, text: str) -> Optional[EncodedAudio]:
+        key = self.tts_cache.make_key(text, self.voice_client.speaker, self.voice_client.model, self.audio_encoder.format)
+        cached = await self.tts_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        start = time.perf_counter()
+        audio, out_ps = await self.voice_client.generate_voice(text)
+        if audio is None:
+            return None
+        synth_seconds = time.perf_counter() - start
+        
+        encoded = await self.audio_encoder.encode(audio)
+        await self.tts_cache.put(key, encoded, synth_seconds)
+        return encoded
             
-        audio = audio.astype(np.float32)
+    async def synthesize_sentence(self, text: str) -> Any:
+        audio, out_ps = await self.voice_client.generate_voice(text)
+        return audio
+    
+    async def stream_voice(self, message: discord.Message, transcription: str, reasoning: str) -> bool:
+        voice_state = getattr(message.author, "voice", None)
+        if not self.voice_streamer.enabled or voice_state is None or voice_state.channel is None:
+            return False
         
-        with io.BytesIO() as wav_buffer:
-            wavfile.write(wav_buffer, 22050, audio)
-            wav_buffer.seek(0)
-            file = discord.File(wav_buffer, filename="audio.wav")
+        voice_client = await self.voice_streamer.connect(voice_state.channel)
+        await self.voice_streamer.speak(voice_client, transcription)
+        
+        transcription = "-# 🔊 " + transcription.replace("\n", "\n-# ")
+        if len(transcription) > 2000:
+            transcription = transcription[:1996].strip() + " ..."
+        if message.author.id == self.bot.dev_id:
+            self.outbound.reply(message, transcription, mention_author=False, view=ButtonView(reasoning, self.bot.dev_id))
+        else:
+            self.outbound.reply(message, transcription, mention_author=False)
+        return True
             
-            transcription = transcription.replace("\n", "\n-# ")
+    async def upload_audio(self, message: discord.Message, encoded: EncodedAudio, transcription: str, reasoning: str) -> None:
+        file = discord.File(io.BytesIO(encoded.data), filename=encoded.filename)
+        
+        transcription = transcription.replace("\n", "\n-# ")
+        
+        if len(transcription) > 2000:
+            transcription = transcription[:1996].strip() + " ..."
             
-            if len(transcription) > 2000:
-                transcription = transcription[:1996].strip() + " ..."
-                
-            if message.author.id == self.bot.dev_id:
-                await message.reply(
-                    content=f"-# {transcription}",
-                    file=file,
-                    mention_author=False,
-                    view=ButtonView(reasoning, self.bot.dev_id)
-                )
-            else:
-                await message.reply(
-                    content=f"-# {transcription}",
-                    file=file,
-                    mention_author=False
-                )
+        if message.author.id == self.bot.dev_id:
+            outbound = self.outbound.reply(
+                message,
+                content=f"-# {transcription}",
+                file=file,
+                mention_author=False,
+                view=ButtonView(reasoning, self.bot.dev_id)
+            )
+        else:
+            outbound = self.outbound.reply(
+                message,
+                content=f"-# {transcription}",
+                file=file,
+                mention_author=False
+            )
+        outbound.future.add_done_callback(
+            lambda f: f.cancelled() or f.exception() or self.audio_encoder.record_upload(encoded, outbound.send_seconds)
+        )
                 
     @staticmethod
     def create_tool_return_json(tool_type: str, content: Any) -> str:
@@ -88,7 +135,28 @@ class DiscordUtils:
             "content": str(error)
         }, indent=4)
         
-    async def handle_tools(self, message: discord.Message, output: ReasoningModel) -> Optional[str]:
+    @staticmethod
+    def readable_channels(guild: discord.Guild, member: discord.Member) -> List[int]:
+        # Only search where the requester could scroll back themselves.
+        channels = [*guild.text_channels, *guild.voice_channels, *guild.threads]
+        return [
+            channel.id for channel in channels
+            if (permissions := channel.permissions_for(member)).read_messages and permissions.read_message_history
+        ]
+    
+    def queue_message(self, message: discord.Message, content: str, reasoning: str) -> OutboundMessage:
+        if message.author.id == self.bot.dev_id:
+            return self.outbound.reply(message, content, mention_author=False, view=ButtonView(reasoning, self.bot.dev_id))
+        return self.outbound.reply(message, content, mention_author=False)
+    
+    async def send_result(self, tool_args: BaseToolArgs, outbound: OutboundMessage) -> Optional[str]:
+        try:
+            await outbound.future
+        except Exception as e:
+            return self.create_error_json(tool_args.tool_type, e)
+        return None
+        
+    async def handle_tools(self, message: discord.Message, output: ReasoningModel) -> List[Optional[str]]:
         reasoning_list = [
             f"-# {line.strip()}" 
             for line in output.reasoning.split("\n") 
@@ -99,53 +167,99 @@ class DiscordUtils:
         if len(output.reasoning) > 2000:
             output.reasoning = output.reasoning[:1996] + " ..."
 
-        if output.tool_args.tool_type in await self.db.get_disabled_tools(message.guild.id):
-            return self.create_error_json(output.tool_args.tool_type, Exception("Tool is disabled."))
+        disabled_tools = await self.db.get_disabled_tools(message.guild.id)
+        results: List[Optional[str]] = [None] * len(output.tool_args)
+        
+        async def run(index: int) -> None:
+            results[index] = await self.run_tool(message, output.tool_args[index], output.reasoning, disabled_tools)
+            
+        async def run_in_order(indices: List[int]) -> None:
+            sends: List[Tuple[int, OutboundMessage]] = []
+            for index in indices:
+                tool_args = output.tool_args[index]
+                if tool_args.tool_type == "send_message":
+                    # Queued in order but awaited together, so consecutive
+                    # messages can still be merged by the queue.
+                    sends.append((index, self.queue_message(message, tool_args.content, output.reasoning)))
+                else:
+                    await run(index)
+            for index, outbound in sends:
+                results[index] = await self.send_result(output.tool_args[index], outbound)
+        
+        # Independent tools run concurrently, but user-visible messages keep
+        # the order the model wrote them in.
+        ordered = [index for index, tool_args in enumerate(output.tool_args) if tool_args.tool_type in ORDERED_TOOLS]
+        await asyncio.gather(
+            run_in_order(ordered),
+            *(run(index) for index in range(len(output.tool_args)) if index not in ordered)
+        )
+        
+        return results
+    
+    async def run_tool(self, message: discord.Message, tool_args: BaseToolArgs, reasoning: str, disabled_tools: List[str]) -> Optional[str]:
+        try:
+            return await self.handle_tool(message, tool_args, reasoning, disabled_tools)
+        except Exception as e:
+            self.logger.error(f"Error running tool {tool_args.tool_type}: {e}")
+            return self.create_error_json(tool_args.tool_type, e)
+        
+    async def handle_tool(self, message: discord.Message, tool_args: BaseToolArgs, reasoning: str, disabled_tools: List[str]) -> Optional[str]:
+        if tool_args.tool_type in disabled_tools:
+            return self.create_error_json(tool_args.tool_type, Exception("Tool is disabled."))
         
         # Basic tools
-        if output.tool_args.tool_type == "send_message":
-            if message.author.id == self.bot.dev_id:
-                await message.reply(output.tool_args.content, mention_author=False, view=ButtonView(output.reasoning, self.bot.dev_id))
-                return
-            await message.reply(output.tool_args.content, mention_author=False)
-            return
+        if tool_args.tool_type == "send_message":
+            return await self.send_result(tool_args, self.queue_message(message, tool_args.content, reasoning))
         
-        if output.tool_args.tool_type == "send_voice_message":
-            audio, out_ps = await self.voice_client.generate_voice(output.tool_args.content)
-            if audio is None:
-                return self.create_error_json(output.tool_args.tool_type, Exception("Failed to generate voice."))
+        if tool_args.tool_type == "send_voice_message":
+            if await self.stream_voice(message, tool_args.content, reasoning):
+                return
+            
+            encoded = await self.synthesize_voice(tool_args.content)
+            if encoded is None:
+                return self.create_error_json(tool_args.tool_type, Exception("Failed to generate voice."))
             
-            await self.upload_audio(message, audio, output.tool_args.content, output.reasoning)
+            await self.upload_audio(message, encoded, tool_args.content, reasoning)
             return
         
-        if output.tool_args.tool_type == "memory_insert":
+        if tool_args.tool_type == "memory_insert":
             if message.author.id == self.bot.dev_id:
-                await message.reply(f"-# Calling tool: {output.tool_args.tool_type}", mention_author=False, view=ButtonView(output.reasoning, self.bot.dev_id))
-            result = await self.client.store_memory(output.tool_args.memory, message.guild.id)
-            return self.create_tool_return_json(output.tool_args.tool_type, result)
+                self.outbound.reply(message, f"-# Calling tool: {tool_args.tool_type}", mention_author=False, view=ButtonView(reasoning, self.bot.dev_id))
+            result = await self.client.store_memory(tool_args.memory, message.guild.id)
+            return self.create_tool_return_json(tool_args.tool_type, result)
             
-        if output.tool_args.tool_type == "memory_retrieve":
+        if tool_args.tool_type == "memory_retrieve":
             if message.author.id == self.bot.dev_id:
-                await message.reply(f"-# Calling tool: {output.tool_args.tool_type}", mention_author=False, view=ButtonView(output.reasoning, self.bot.dev_id))
-            result = await self.client.retrieve_memory(output.tool_args.memory, message.guild.id)
-            return self.create_tool_return_json(output.tool_args.tool_type, result)
+                self.outbound.reply(message, f"-# Calling tool: {tool_args.tool_type}", mention_author=False, view=ButtonView(reasoning, self.bot.dev_id))
+            result = await self.client.retrieve_memory(tool_args.memory, message.guild.id)
+            return self.create_tool_return_json(tool_args.tool_type, result)
+        
+        if tool_args.tool_type == "search_history":
+            if message.author.id == self.bot.dev_id:
+                self.outbound.reply(message, f"-# Calling tool: {tool_args.tool_type}", mention_author=False, view=ButtonView(reasoning, self.bot.dev_id))
+            if tool_args.scope == "server":
+                channel_ids = self.readable_channels(message.guild, message.author)
+            else:
+                channel_ids = [message.channel.id]
+            results = await self.db.search_history(tool_args.query, channel_ids)
+            return self.create_tool_return_json(tool_args.tool_type, results or "No matching messages found.")
         
-        if output.tool_args.tool_type == "dice_roll":
+        if tool_args.tool_type == "dice_roll":
             if message.author.id == self.bot.dev_id:
-                await message.reply(f"-# Calling tool: {output.tool_args.tool_type}", mention_author=False, view=ButtonView(output.reasoning, self.bot.dev_id))
-            result = random.randint(1, output.tool_args.sides)
-            return self.create_tool_return_json(output.tool_args.tool_type, result)
+                self.outbound.reply(message, f"-# Calling tool: {tool_args.tool_type}", mention_author=False, view=ButtonView(reasoning, self.bot.dev_id))
+            result = random.randint(1, tool_args.sides)
+            return self.create_tool_return_json(tool_args.tool_type, result)
         
-        if output.tool_args.tool_type == "add_reaction":
+        if tool_args.tool_type == "add_reaction":
             if message.author.id == self.bot.dev_id:
-                await message.reply(f"-# Calling tool: {output.tool_args.tool_type}", mention_author=False, view=ButtonView(output.reasoning, self.bot.dev_id))
-            await message.add_reaction(output.tool_args.emoji)
-            return self.create_tool_return_json(output.tool_args.tool_type, "Reaction added.")
+                self.outbound.reply(message, f"-# Calling tool: {tool_args.tool_type}", mention_author=False, view=ButtonView(reasoning, self.bot.dev_id))
+            await message.add_reaction(tool_args.emoji)
+            return self.create_tool_return_json(tool_args.tool_type, "Reaction added.")
         
-        if output.tool_args.tool_type == "generate_image":
+        if tool_args.tool_type == "generate_image":
             if message.author.id == self.bot.dev_id:
-                await message.reply(f"-# Calling tool: {output.tool_args.tool_type}", mention_author=False, view=ButtonView(output.reasoning, self.bot.dev_id))
-            image_url = await self.img.generate_image(output.tool_args.prompt)
+                self.outbound.reply(message, f"-# Calling tool: {tool_args.tool_type}", mention_author=False, view=ButtonView(reasoning, self.bot.dev_id))
+            image_url = await self.img.generate_image(tool_args.prompt)
             
             async with aiohttp.ClientSession() as session:
                 async with session.get(image_url) as response:
@@ -153,8 +267,10 @@ class DiscordUtils:
                         image_data = await response.read()
                         image = io.BytesIO(image_data)
                         image.seek(0)
-                        await message.reply(file=discord.File(image, filename="image.png"), mention_author=False)
+                        self.outbound.reply(message, file=discord.File(image, filename="image.png"), mention_author=False)
+                        # Generated image URLs expire, keep our own copy for the history.
+                        image_url = await self.db.image_cache.store_bytes(image_data)
                         
-            return self.create_tool_return_json(output.tool_args.tool_type, image_url)
+            return self.create_tool_return_json(tool_args.tool_type, image_url)
         
-        return self.create_error_json(output.tool_args.tool_type, Exception("Tool not found."))
\ No newline at end of file
+        return self.create_error_json(tool_args.tool_type, Exception("Tool not found."))
\ No newline at end of file
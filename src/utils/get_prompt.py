@@ -4,28 +4,44 @@ from discord.ext import commands
 import chromadb
 from chromadb import Settings
 
+from typing import List
+
 from utils.tools import get_tool_info
+from utils.models import REASONING_MODES
+from services.embeddings import memory_collection_name
 
 def get_memory_count() -> int:
-    collection = chromadb.PersistentClient(path="./db", settings=Settings(anonymized_telemetry=False)).get_or_create_collection(name="memory")
+    collection = chromadb.PersistentClient(path="./db", settings=Settings(anonymized_telemetry=False)).get_or_create_collection(name=memory_collection_name())
     collection_items = collection.get()
     return len(collection_items['documents'])
 
-async def generate_system_prompt(bot: commands.Bot, channel: discord.TextChannel) -> str:
+def format_prefetched_memories(memories: List[str]) -> str:
+    if not memories:
+        return ""
+    entries = "\n\n".join(f"- {memory}" for memory in memories)
+    return f'''
+
+## Relevant Memories
+These memories were retrieved automatically for the latest message. Use them directly and only call `memory_retrieve` for something they don't cover.
+
+{entries}'''
+
+async def generate_system_prompt(bot: commands.Bot, channel: discord.TextChannel, mode: str = "deep") -> str:
     return f'''
 You are a Discord bot named {bot.bot_name} designed for in-depth, self-questioning reasoning resembling human stream-of-consciousness thinking. Interacting through `{bot.user.id}` in server `{bot.server_name}`, specifically in `{channel.name}` ({channel.mention}), you should think step-by-step.
 You are not an AI, but a human-like thinker with a deep, contemplative persona.
 
 ## Output Format
 - `reasoning` field: Your thorough and detailed step-by-step thinking process goes here. Do not include the final answer.
-- `tool_args` field: Your tool choice and arguments go here.
+- `tool_args` field: A list of your tool choices and their arguments goes here.
 
 ## Tool List
 {await get_tool_info(channel.guild.id, omit_disabled=True)}
 
 ## Tool Usage
 - If a tool call fails, notify the user and propose alternatives without retrying automatically.
-- For user messages requiring multiple tool calls, execute them one by one.
+- For user messages requiring multiple independent tool calls (e.g. reacting, rolling a dice and storing a memory), list them all in `tool_args` of the same turn. They run at the same time and you receive all of their results together.
+- If a tool call needs the result of another one, call the first tool and wait for its result before calling the next.
 - Think extensively on what tool is the best choice and why based on the user's input.
 
 ## Number of Items in Memory
@@ -35,7 +51,7 @@ You are not an AI, but a human-like thinker with a deep, contemplative persona.
 {bot.persona}
 
 ## Key Requirements
-1. Always engage in extensive contemplation before choosing a tool (minimum 10,000 characters).
+1. {REASONING_MODES[mode]["requirement"]}
 2. Keep exploring until a solution emerges naturally.
 3. You are not here to assist the user, so avoid phrases like "How can I assist you?" or "What can I help you with?"
 4. Make a natural, human-like conversation.
@@ -0,0 +1,142 @@
+from decouple import config
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.metrics import LatencyStats
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+StackKey = Tuple[Tuple[str, int, str], ...]
+
+@dataclass
+class Offender:
+    stack: List[traceback.FrameSummary]
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def record(self, lag: float) -> None:
+        self.count += 1
+        self.total += lag
+        self.max = max(self.max, lag)
+
+    @property
+    def location(self) -> str:
+        # The innermost frame from our own code is usually the one to fix,
+        # the frames below it belong to the library doing the blocking.
+        frame = next((frame for frame in reversed(self.stack) if frame.filename.startswith(SOURCE_DIR)), self.stack[-1])
+        return f"{frame.name} ({frame.filename.rsplit('/', 1)[-1]}:{frame.lineno})"
+
+class LoopMonitor:
+    def __init__(self) -> None:
+        self.enabled = config("LOOP_MONITOR", default=True, cast=bool)
+        self.interval = config("LOOP_MONITOR_INTERVAL_MS", default=100, cast=int) / 1000
+        self.threshold = config("LOOP_LAG_THRESHOLD_MS", default=100, cast=int) / 1000
+        self.depth = config("LOOP_MONITOR_STACK_DEPTH", default=12, cast=int)
+        self.logger = logging.getLogger(__name__)
+
+        self.lag = LatencyStats()
+        self.stalls = 0
+        self.offenders: Dict[StackKey, Offender] = {}
+        self._beat = time.monotonic()
+        self._captured: Optional[Tuple[float, List[traceback.FrameSummary]]] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def start(self) -> None:
+        if not self.enabled or self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop_event.clear()
+        self._task = asyncio.create_task(self._tick())
+        self._thread = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    async def _tick(self) -> None:
+        while True:
+            beat = self._beat
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - beat - self.interval)
+            self._beat = now
+            self.lag.record(lag)
+            if lag >= self.threshold:
+                self._report(beat, lag)
+
+    def _watch(self) -> None:
+        # Runs outside the loop, so it can look at the loop thread while the
+        # loop itself is stuck.
+        while not self._stop_event.wait(self.interval / 2):
+            beat = self._beat
+            if time.monotonic() - beat < self.interval + self.threshold:
+                continue
+            if self._captured is not None and self._captured[0] == beat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                self._captured = (beat, traceback.extract_stack(frame)[-self.depth:])
+
+    def _report(self, beat: float, lag: float) -> None:
+        self.stalls += 1
+        captured, self._captured = self._captured, None
+        if captured is None or captured[0] != beat:
+            self.logger.warning(f"Event loop blocked for {lag * 1000:.0f}ms (no stack captured)")
+            return
+
+        stack = captured[1]
+        key = tuple((frame.filename, frame.lineno, frame.name) for frame in stack)
+        offender = self.offenders.get(key)
+        if offender is None:
+            offender = self.offenders[key] = Offender(stack)
+        offender.record(lag)
+        self.logger.warning(
+            f"Event loop blocked for {lag * 1000:.0f}ms in {offender.location}:\n"
+            + "".join(traceback.format_list(stack)).rstrip()
+        )
+
+    def reset(self) -> None:
+        self.offenders.clear()
+        self.stalls = 0
+
+    def worst(self, limit: int = 5) -> List[Offender]:
+        return sorted(self.offenders.values(), key=lambda offender: -offender.total)[:limit]
+
+    def summary(self, limit: int = 5) -> str:
+        lag = self.lag.summary()
+        lines = [
+            f"Loop lag: avg {lag['avg_ms']}ms, p95 {lag['p95_ms']}ms, max {lag['max_ms']}ms over {lag['count']} ticks",
+            f"Stalls over {self.threshold * 1000:.0f}ms: {self.stalls}",
+        ]
+        for offender in self.worst(limit):
+            lines.append(f"  {offender.total * 1000:>8.0f}ms total, {offender.count}x, max {offender.max * 1000:.0f}ms  {offender.location}")
+            lines.extend(f"      {frame.name} ({frame.filename.rsplit('/', 1)[-1]}:{frame.lineno})" for frame in offender.stack[-4:])
+        return "\n".join(lines)
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {"enabled": False}
+        return {
+            "stalls": self.stalls,
+            "offenders": len(self.offenders),
+            **{f"lag_{key}": value for key, value in self.lag.summary().items()},
+        }
@@ -0,0 +1,151 @@
+import discord
+from decouple import config
+
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from utils.send_queue import Throttle
+
+MISSING = object()
+
+@dataclass(frozen=True)
+class CachedMessage:
+    id: int
+    author_id: int
+    content: str
+
+    @classmethod
+    def from_message(cls, message: discord.Message) -> "CachedMessage":
+        return cls(id=message.id, author_id=message.author.id, content=message.content or "")
+
+class MessageCache:
+    """Snapshots of recently seen messages, used to resolve reply references
+    without relying on discord.py's message cache or the API."""
+
+    def __init__(self) -> None:
+        self.per_channel = config("MESSAGE_CACHE_PER_CHANNEL", default=200, cast=int)
+        self.max_channels = config("MESSAGE_CACHE_CHANNELS", default=1000, cast=int)
+        self.fetch_limiter = Throttle(
+            config("MESSAGE_FETCH_RATE_LIMIT", default=5, cast=int),
+            config("MESSAGE_FETCH_RATE_PERIOD", default=1.0, cast=float)
+        )
+        self.max_fetch_wait = config("MESSAGE_FETCH_MAX_WAIT", default=2.0, cast=float)
+        self.logger = logging.getLogger(__name__)
+
+        # None marks a message that could not be fetched, so it isn't retried
+        # for every reply to it.
+        self.channels: "OrderedDict[int, OrderedDict[int, Optional[CachedMessage]]]" = OrderedDict()
+        self._fetches: Dict[int, asyncio.Future] = {}
+
+        self.hits = 0
+        self.gateway_hits = 0
+        self.fetches = 0
+        self.deduplicated = 0
+        self.failed = 0
+        self.skipped = 0
+
+    def _store(self, channel_id: int, message_id: int, entry: Optional[CachedMessage]) -> None:
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.channels[channel_id] = OrderedDict()
+            if len(self.channels) > self.max_channels:
+                self.channels.popitem(last=False)
+        else:
+            self.channels.move_to_end(channel_id)
+        channel[message_id] = entry
+        channel.move_to_end(message_id)
+        if len(channel) > self.per_channel:
+            channel.popitem(last=False)
+
+    def remember(self, message: discord.Message) -> None:
+        self._store(message.channel.id, message.id, CachedMessage.from_message(message))
+
+    def get(self, channel_id: int, message_id: int) -> Any:
+        channel = self.channels.get(channel_id)
+        if channel is None or message_id not in channel:
+            return MISSING
+        channel.move_to_end(message_id)
+        return channel[message_id]
+
+    async def resolve(self, message: discord.Message) -> Optional[CachedMessage]:
+        reference = message.reference
+        if reference is None or reference.message_id is None:
+            return None
+        channel_id = reference.channel_id or message.channel.id
+
+        cached = self.get(channel_id, reference.message_id)
+        if cached is not MISSING:
+            self.hits += 1
+            return cached
+
+        if isinstance(reference.resolved, discord.Message):
+            self.gateway_hits += 1
+            self.remember(reference.resolved)
+            return CachedMessage.from_message(reference.resolved)
+
+        # Several messages replying to the same one share a single fetch.
+        pending = self._fetches.get(reference.message_id)
+        if pending is not None:
+            self.deduplicated += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._fetches[reference.message_id] = future
+        try:
+            result = await self._fetch(message, channel_id, reference.message_id)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters re-raise it; don't warn if there were none.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._fetches[reference.message_id]
+
+    async def _fetch(self, message: discord.Message, channel_id: int, message_id: int) -> Optional[CachedMessage]:
+        # A reply without its reference is better than a reply that waits
+        # for the rate limit.
+        if self.fetch_limiter.delay() > self.max_fetch_wait:
+            self.skipped += 1
+            return None
+        await self.fetch_limiter.acquire()
+
+        channel = message.channel if channel_id == message.channel.id else message.guild.get_channel_or_thread(channel_id)
+        if channel is None:
+            self._store(channel_id, message_id, None)
+            return None
+
+        self.fetches += 1
+        try:
+            fetched = await channel.fetch_message(message_id)
+        except (discord.NotFound, discord.Forbidden):
+            self.failed += 1
+            self._store(channel_id, message_id, None)
+            return None
+        except discord.HTTPException as e:
+            self.failed += 1
+            self.logger.warning(f"Failed to fetch referenced message {message_id}: {e}")
+            return None
+
+        self.remember(fetched)
+        return CachedMessage.from_message(fetched)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "channels": len(self.channels),
+            "messages": sum(len(channel) for channel in self.channels.values()),
+            "hits": self.hits,
+            "gateway_hits": self.gateway_hits,
+            "fetches": self.fetches,
+            "deduplicated": self.deduplicated,
+            "failed": self.failed,
+            "skipped": self.skipped,
+        }
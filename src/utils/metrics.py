@@ -0,0 +1,29 @@
+from collections import deque
+from typing import Any, Dict
+
+class LatencyStats:
+    def __init__(self, window: int = 500) -> None:
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000) if self.count else 0,
+            "p95_ms": round(self.percentile(0.95) * 1000),
+            "max_ms": round(self.max * 1000),
+        }
\ No newline at end of file
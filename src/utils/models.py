@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field, field_validator
-from typing import Literal, Union, Optional
+from pydantic import BaseModel, Field, PrivateAttr, create_model, field_validator
+from typing import Literal, Union, Optional, List, Dict, ClassVar, Type, FrozenSet
+from functools import lru_cache
 
 class BaseToolArgs(BaseModel):
     """Base class for all tool arguments."""
@@ -42,6 +43,12 @@ class GenerateImage(BaseToolArgs):
     tool_type: Literal["generate_image"]
     prompt: str = Field(..., description="Prompt to generate the image with.")
 
+class SearchHistory(BaseToolArgs):
+    """A tool to search older messages of the conversation by keywords. Use this to recall exact details that are no longer in the conversation."""
+    tool_type: Literal["search_history"]
+    query: str = Field(..., description="Keywords to search for.")
+    scope: Literal["channel", "server"] = Field(..., description="Search only this channel, or every channel of the server the user can read.")
+
 ToolArgs = Union[
     SendMessage,
     SendVoiceMessage,
@@ -50,21 +57,91 @@ ToolArgs = Union[
     DiceRoll,
     AddReaction,
     GenerateImage,
+    SearchHistory,
 ]
 
+REASONING_MODES = {
+    "fast": {
+        "max_chars": 1500,
+        "requirement": "Think briefly before choosing a tool: a few focused sentences are enough (maximum 1,500 characters).",
+    },
+    "normal": {
+        "max_chars": 8000,
+        "requirement": "Think carefully before choosing a tool (roughly 2,000 to 8,000 characters).",
+    },
+    "deep": {
+        "max_chars": 40000,
+        "requirement": "Always engage in extensive contemplation before choosing a tool (minimum 10,000 characters).",
+    },
+}
+
+ReasoningMode = Literal["fast", "normal", "deep"]
+
 class ReasoningModel(BaseModel):
     reasoning: str = Field(
         ...,
         description="Detailed and long step-by-step reasoning. Do not include the output here.",
         alias="think"
     )
-    tool_args: ToolArgs = Field(
+    tool_args: List[ToolArgs] = Field(
         ...,
-        description="For tool calls, choose the appropriate tool and provide the necessary arguments here. If no tool is needed, set this to `null`."
+        description="Tool calls to run in this turn, with the necessary arguments for each. Several independent calls may be listed; they run concurrently and all of their results come back together. Calls that depend on another call's result must wait for a later turn. If no tool is needed, leave this empty."
     )
+    # Token usage reported by the backend, not part of the schema.
+    _usage: Dict[str, int] = PrivateAttr(default_factory=dict)
+    max_reasoning_chars: ClassVar[Optional[int]] = None
+
+    @field_validator("reasoning", mode="before")
+    def cap_reasoning(cls, v):
+        # Backends that can't enforce maxLength while decoding (OpenAI) still
+        # generate the full reasoning; it is only shortened here, so the
+        # stored turn stays within the mode's size.
+        if cls.max_reasoning_chars and isinstance(v, str) and len(v) > cls.max_reasoning_chars:
+            return v[:cls.max_reasoning_chars]
+        return v
+
+    @field_validator("tool_args", mode="before")
+    def wrap_single_tool(cls, v):
+        if isinstance(v, (dict, BaseToolArgs)):
+            return [v]
+        return v
 
     @field_validator("tool_args")
     def validate_tool_args(cls, v):
-        if v is not None and not isinstance(v, BaseToolArgs):
-            raise ValueError("Tool arguments must be a valid tool type")
-        return v
\ No newline at end of file
+        for tool in v:
+            if not isinstance(tool, BaseToolArgs):
+                raise ValueError("Tool arguments must be a valid tool type")
+        return v
+
+def tool_type_of(tool_class: Type[BaseToolArgs]) -> str:
+    return tool_class.model_fields["tool_type"].annotation.__args__[0]
+
+@lru_cache(maxsize=None)
+def get_reasoning_model(mode: str, schema_length_limit: bool = True, disabled_tools: FrozenSet[str] = frozenset()) -> Type[ReasoningModel]:
+    max_chars = REASONING_MODES[mode]["max_chars"]
+    fields = {}
+    if schema_length_limit:
+        fields["reasoning"] = (str, Field(
+            ...,
+            description="Step-by-step reasoning. Do not include the output here.",
+            alias="think",
+            max_length=max_chars
+        ))
+    
+    # Disabled tools are left out of the schema entirely, so constrained
+    # decoding can't pick them and has a smaller grammar to follow.
+    enabled_tools = tuple(
+        tool for tool in ToolArgs.__args__
+        if tool_type_of(tool) not in disabled_tools or tool is SendMessage
+    )
+    if len(enabled_tools) != len(ToolArgs.__args__):
+        fields["tool_args"] = (List[Union[enabled_tools]], Field(
+            ...,
+            description=ReasoningModel.model_fields["tool_args"].description
+        ))
+    
+    suffix = "".join(sorted(tool_type_of(tool).title().replace("_", "") for tool in set(ToolArgs.__args__) - set(enabled_tools)))
+    name = f"ReasoningModel{mode.title()}" + (f"Without{suffix}" if suffix else "")
+    model = create_model(name, __base__=ReasoningModel, **fields)
+    model.max_reasoning_chars = max_chars
+    return model
\ No newline at end of file
@@ -0,0 +1,190 @@
+from decouple import config
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+NULL_CONTEXT = nullcontext()
+
+class StackSampler(threading.Thread):
+    def __init__(self, thread_id: int, interval: float) -> None:
+        super().__init__(name="message-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def stop(self) -> Counter:
+        self._stop_event.set()
+        self.join()
+        return self.stacks
+
+@dataclass
+class ProfileSession:
+    channel_id: int
+    remaining: Optional[int]
+    deadline: Optional[float]
+    on_finish: Optional[Callable[[str], Any]] = None
+    stacks: Counter = field(default_factory=Counter)
+    phases: Dict[str, float] = field(default_factory=lambda: defaultdict(float))
+    messages: int = 0
+    total_seconds: float = 0.0
+    active: int = 0
+    sampler: Optional[StackSampler] = None
+    timer: Optional[asyncio.TimerHandle] = None
+
+class MessageProfiler:
+    def __init__(self, output_dir: str = "./db/profiles") -> None:
+        self.output_dir = output_dir
+        self.interval = config("PROFILE_SAMPLE_INTERVAL_MS", default=5, cast=int) / 1000
+        self.sessions: Dict[int, ProfileSession] = {}
+        self.logger = logging.getLogger(__name__)
+
+    def arm(self, channel_id: int, messages: Optional[int] = None, seconds: Optional[float] = None, on_finish: Optional[Callable[[str], Any]] = None) -> ProfileSession:
+        self.disarm(channel_id)
+        session = ProfileSession(
+            channel_id=channel_id,
+            remaining=messages,
+            deadline=time.monotonic() + seconds if seconds else None,
+            on_finish=on_finish
+        )
+        if seconds:
+            session.timer = asyncio.get_running_loop().call_later(seconds, self._expire, session)
+        self.sessions[channel_id] = session
+        return session
+
+    def disarm(self, channel_id: int) -> None:
+        session = self.sessions.pop(channel_id, None)
+        if session is not None:
+            self._stop_sampler(session)
+            if session.timer is not None:
+                session.timer.cancel()
+
+    def _expire(self, session: ProfileSession) -> None:
+        # The window is over, but let in-flight messages finish first.
+        session.deadline = 0
+        if session.active == 0 and self.sessions.get(session.channel_id) is session:
+            self._finish(session)
+
+    @contextmanager
+    def _message(self, session: ProfileSession) -> Iterator[None]:
+        if session.sampler is None:
+            session.sampler = StackSampler(threading.get_ident(), self.interval)
+            session.sampler.start()
+        session.active += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            session.total_seconds += time.perf_counter() - start
+            session.active -= 1
+            session.messages += 1
+            if session.remaining is not None:
+                session.remaining -= 1
+            if session.active == 0:
+                self._stop_sampler(session)
+                if self._is_done(session):
+                    self._finish(session)
+
+    def message(self, channel_id: int) -> Any:
+        # Disarmed channels only pay for a dict lookup.
+        session = self.sessions.get(channel_id)
+        if session is None:
+            return NULL_CONTEXT
+        return self._message(session)
+
+    @contextmanager
+    def _phase(self, session: ProfileSession, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            session.phases[name] += time.perf_counter() - start
+
+    def phase(self, channel_id: int, name: str) -> Any:
+        session = self.sessions.get(channel_id)
+        if session is None or session.active == 0:
+            return NULL_CONTEXT
+        return self._phase(session, name)
+
+    @staticmethod
+    def _is_done(session: ProfileSession) -> bool:
+        if session.remaining is not None and session.remaining <= 0:
+            return True
+        return session.deadline is not None and time.monotonic() >= session.deadline
+
+    def _stop_sampler(self, session: ProfileSession) -> None:
+        if session.sampler is not None:
+            session.stacks.update(session.sampler.stop())
+            session.sampler = None
+
+    def _finish(self, session: ProfileSession) -> None:
+        self.disarm(session.channel_id)
+        try:
+            summary = self.write(session)
+        except OSError as e:
+            self.logger.error(f"Failed to write profile for channel {session.channel_id}: {e}")
+            return
+        self.logger.info(summary)
+        if session.on_finish is not None:
+            result = session.on_finish(summary)
+            if asyncio.iscoroutine(result):
+                asyncio.create_task(result)
+
+    @staticmethod
+    def function_totals(stacks: Counter) -> Tuple[Counter, Counter]:
+        own, total = Counter(), Counter()
+        for stack, count in stacks.items():
+            own[stack[-1]] += count
+            for function in set(stack):
+                total[function] += count
+        return own, total
+
+    def summarize(self, session: ProfileSession, paths: List[str]) -> str:
+        lines = [f"Profile of channel {session.channel_id}: {session.messages} message(s), {session.total_seconds:.2f}s handled"]
+        for name, seconds in sorted(session.phases.items(), key=lambda item: -item[1]):
+            share = seconds / session.total_seconds if session.total_seconds else 0
+            lines.append(f"  {name:<8} {seconds * 1000:>9.1f}ms  {share:>5.0%}")
+
+        samples = sum(session.stacks.values())
+        own, total = self.function_totals(session.stacks)
+        lines.append(f"Top functions ({samples} samples, own / cumulative):")
+        for function, count in own.most_common(10):
+            lines.append(f"  {count / samples:>5.1%} / {total[function] / samples:>5.1%}  {function}")
+        lines.extend(f"Wrote {path}" for path in paths)
+        return "\n".join(lines)
+
+    def write(self, session: ProfileSession) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{session.channel_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+
+        # Collapsed stacks, readable by flamegraph.pl and speedscope.
+        folded_path = base + ".folded"
+        with open(folded_path, "w") as f:
+            for stack, count in session.stacks.most_common():
+                f.write(";".join(frame.replace(";", ":") for frame in stack) + f" {count}\n")
+
+        summary_path = base + ".txt"
+        summary = self.summarize(session, [folded_path, summary_path])
+        with open(summary_path, "w") as f:
+            f.write(summary + "\n")
+        return summary
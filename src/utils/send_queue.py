@@ -0,0 +1,192 @@
+import discord
+from decouple import config
+
+import time
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from utils.metrics import LatencyStats
+
+MAX_MESSAGE_LENGTH = 2000
+
+def split_content(content: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    parts = []
+    while len(content) > limit:
+        # Prefer breaking at a line, then at a word, over cutting a word in half.
+        cut = content.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = content.rfind(" ", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        parts.append(content[:cut])
+        content = content[cut:].lstrip("\n ")
+    if content or not parts:
+        parts.append(content)
+    return parts
+
+class Throttle:
+    """A local sliding-window throttle. discord.py already follows Discord's
+    rate limit headers and retries 429s; this only spaces out our own calls
+    so bursts queue up here, where they can still be merged or skipped."""
+
+    def __init__(self, rate: int, per: float) -> None:
+        self.rate = rate
+        self.per = per
+        self.sent: Deque[float] = deque()
+
+    def delay(self) -> float:
+        now = time.monotonic()
+        while self.sent and self.sent[0] <= now - self.per:
+            self.sent.popleft()
+        if len(self.sent) < self.rate:
+            return 0.0
+        return self.sent[0] + self.per - now
+
+    async def acquire(self) -> None:
+        while (delay := self.delay()) > 0:
+            await asyncio.sleep(delay)
+        self.sent.append(time.monotonic())
+
+@dataclass
+class OutboundMessage:
+    reference: discord.Message
+    content: Optional[str]
+    kwargs: Dict[str, Any]
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    send_seconds: float = 0.0
+    # The remaining parts of a split reply.
+    rest: List["OutboundMessage"] = field(default_factory=list)
+
+    @property
+    def mergeable(self) -> bool:
+        # Only plain text can be merged, anything carrying a file or a view
+        # has to be sent as its own message.
+        return self.content is not None and set(self.kwargs) <= {"mention_author"}
+
+    def can_merge(self, other: "OutboundMessage", content: str) -> bool:
+        return (
+            self.mergeable and other.mergeable
+            and self.reference.id == other.reference.id
+            and self.kwargs == other.kwargs
+            and len(content) + 1 + len(other.content) <= MAX_MESSAGE_LENGTH
+        )
+
+class ChannelSender:
+    def __init__(self, outbound: "OutboundQueue") -> None:
+        self.outbound = outbound
+        self.limiter = Throttle(outbound.channel_rate, outbound.channel_period)
+        self.pending: Deque[OutboundMessage] = deque()
+        self.worker: Optional[asyncio.Task] = None
+
+    def push(self, item: OutboundMessage) -> None:
+        self.pending.append(item)
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while self.pending:
+            # Messages keep queueing up while we wait for the throttle, which
+            # gives consecutive short sends a chance to be merged.
+            await self.limiter.acquire()
+            await self.outbound.global_limiter.acquire()
+
+            # The rest of a split reply is dropped once one of its parts failed.
+            while self.pending and self.pending[0].future.done():
+                self.pending.popleft()
+            if not self.pending:
+                break
+
+            batch = [self.pending.popleft()]
+            content = batch[0].content
+            while self.pending and batch[0].can_merge(self.pending[0], content):
+                content = f"{content}\n{self.pending[0].content}"
+                batch.append(self.pending.popleft())
+
+            await self.outbound.send(batch, content)
+
+class OutboundQueue:
+    def __init__(self, on_sent: Optional[Callable[[discord.Message], Any]] = None) -> None:
+        self.on_sent = on_sent
+        self.channel_rate = config("SEND_THROTTLE_LIMIT", default=5, cast=int)
+        self.channel_period = config("SEND_THROTTLE_PERIOD", default=5.0, cast=float)
+        self.global_limiter = Throttle(
+            config("SEND_GLOBAL_THROTTLE_LIMIT", default=40, cast=int),
+            1.0
+        )
+        self.channels: Dict[int, ChannelSender] = {}
+        self.logger = logging.getLogger(__name__)
+
+        self.latency = LatencyStats()
+        self.sent_count = 0
+        self.merged_count = 0
+        self.failed_count = 0
+
+    def reply(self, reference: discord.Message, content: Optional[str] = None, **kwargs: Any) -> OutboundMessage:
+        """Queue a reply, split into several messages if it is too long.
+
+        The returned item is the last part; its future fails if any part
+        failed to send."""
+        loop = asyncio.get_running_loop()
+        parts = split_content(content) if content is not None else [None]
+        items = []
+        for index, part in enumerate(parts):
+            last = index == len(parts) - 1
+            future = loop.create_future()
+            # Callers don't always await their sends; failures are logged here.
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            # Files and views go with the last part.
+            part_kwargs = kwargs if last else {key: value for key, value in kwargs.items() if key == "mention_author"}
+            items.append(OutboundMessage(reference=reference, content=part, kwargs=part_kwargs, future=future))
+
+        for index, item in enumerate(items):
+            item.rest = items[index + 1:]
+
+        channel_id = reference.channel.id
+        if channel_id not in self.channels:
+            self.channels[channel_id] = ChannelSender(self)
+        for item in items:
+            self.channels[channel_id].push(item)
+        return items[-1]
+
+    async def send(self, batch: List[OutboundMessage], content: Optional[str]) -> None:
+        head = batch[0]
+        start = time.perf_counter()
+        try:
+            sent = await head.reference.reply(content, **head.kwargs)
+        except Exception as e:
+            self.failed_count += len(batch)
+            self.logger.error(f"Failed to send message in channel {head.reference.channel.id}: {e}")
+            for item in batch:
+                for failed in (item, *item.rest):
+                    if not failed.future.done():
+                        failed.future.set_exception(e)
+            return
+
+        end = time.perf_counter()
+        if self.on_sent is not None:
+            self.on_sent(sent)
+        self.sent_count += 1
+        self.merged_count += len(batch) - 1
+        for item in batch:
+            item.send_seconds = end - start
+            self.latency.record(end - item.enqueued_at)
+            if not item.future.done():
+                item.future.set_result(sent)
+
+    async def drain(self) -> None:
+        workers = [sender.worker for sender in self.channels.values() if sender.worker and not sender.worker.done()]
+        if workers:
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sent": self.sent_count,
+            "merged": self.merged_count,
+            "failed": self.failed_count,
+            "queued": sum(len(sender.pending) for sender in self.channels.values()),
+            **{f"latency_{key}": value for key, value in self.latency.summary().items()},
+        }
@@ -5,8 +5,8 @@ from textwrap import dedent
 from typing import Any, Type
 from pydantic import Field
 
-from utils.models import BaseToolArgs
-from services.database import DatabaseService
+from utils.models import BaseToolArgs, tool_type_of
+from services.database import get_database_service
 import utils.models as models
 
 @dataclass
@@ -63,8 +63,7 @@ async def get_tool_info(guild_id: int, omit_disabled: bool = False) -> str:
     formatter = ToolFormatter()
     
     if omit_disabled:
-        db = DatabaseService()
-        disabled_tools = await db.get_disabled_tools(guild_id)
+        disabled_tools = await get_database_service().get_disabled_tools(guild_id)
         tools_set = {
             obj for name, obj in (
                 inspect.getmembers(sys.modules[__name__]) + inspect.getmembers(models)
@@ -73,7 +72,7 @@ async def get_tool_info(guild_id: int, omit_disabled: bool = False) -> str:
                 issubclass(obj, BaseToolArgs) and 
                 obj != BaseToolArgs and 
                 obj.model_fields.get('tool_type', None) and
-                obj.model_fields['tool_type'].default not in disabled_tools)
+                tool_type_of(obj) not in disabled_tools)
         }
     else:
         tools_set = {
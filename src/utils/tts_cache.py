@@ -0,0 +1,154 @@
+from decouple import config
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from utils.audio_utils import EncodedAudio
+
+@dataclass
+class CacheEntry:
+    filename: str
+    size: int
+    raw_size: int
+    synth_seconds: float
+
+class TTSCache:
+    def __init__(self, cache_dir: str = "./db/tts_cache") -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = config("TTS_CACHE_MAX_MB", default=256, cast=int) * 1024 * 1024
+        self.enabled = self.max_bytes > 0
+        self.logger = logging.getLogger(__name__)
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._load_index()
+
+    @staticmethod
+    def make_key(text: str, speaker: str, model: str, audio_format: str) -> str:
+        payload = json.dumps([model, speaker, audio_format, text], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_index(self) -> None:
+        # Least recently used first, recency is persisted through the mtime of
+        # the metadata file.
+        metas = sorted(
+            (name for name in os.listdir(self.cache_dir) if name.endswith(".json")),
+            key=lambda name: os.path.getmtime(os.path.join(self.cache_dir, name))
+        )
+        for name in metas:
+            key = name[:-len(".json")]
+            try:
+                with open(self._meta_path(key), "r") as f:
+                    entry = CacheEntry(**json.load(f))
+                if not os.path.exists(os.path.join(self.cache_dir, entry.filename)):
+                    raise FileNotFoundError(entry.filename)
+            except Exception as e:
+                self.logger.warning(f"Dropping broken TTS cache entry {key}: {e}")
+                self._remove_files(key, None)
+                continue
+            self.entries[key] = entry
+            self.total_bytes += entry.size
+
+        self.logger.info(f"TTS cache loaded: {len(self.entries)} entries, {self.total_bytes / 1024 / 1024:.1f}MB")
+
+    def _remove_files(self, key: str, entry: Optional[CacheEntry]) -> None:
+        paths = [self._meta_path(key)]
+        if entry is not None:
+            paths.append(os.path.join(self.cache_dir, entry.filename))
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _read(self, key: str, entry: CacheEntry) -> bytes:
+        with open(os.path.join(self.cache_dir, entry.filename), "rb") as f:
+            data = f.read()
+        os.utime(self._meta_path(key))
+        return data
+
+    def _write(self, key: str, entry: CacheEntry, data: bytes) -> None:
+        with open(os.path.join(self.cache_dir, entry.filename), "wb") as f:
+            f.write(data)
+        with open(self._meta_path(key), "w") as f:
+            json.dump(entry.__dict__, f)
+
+    async def get(self, key: str) -> Optional[EncodedAudio]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        try:
+            data = await asyncio.to_thread(self._read, key, entry)
+        except OSError as e:
+            self.logger.warning(f"Failed to read TTS cache entry {key}: {e}")
+            self._evict(key)
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        self.saved_seconds += entry.synth_seconds
+        return EncodedAudio(
+            data=data,
+            filename=f"audio{os.path.splitext(entry.filename)[1]}",
+            raw_size=entry.raw_size,
+            encode_seconds=0.0
+        )
+
+    async def put(self, key: str, encoded: EncodedAudio, synth_seconds: float) -> None:
+        if not self.enabled or encoded.size > self.max_bytes:
+            return
+
+        entry = CacheEntry(
+            filename=f"{key}{os.path.splitext(encoded.filename)[1]}",
+            size=encoded.size,
+            raw_size=encoded.raw_size,
+            synth_seconds=synth_seconds
+        )
+        try:
+            await asyncio.to_thread(self._write, key, entry, encoded.data)
+        except OSError as e:
+            self.logger.warning(f"Failed to write TTS cache entry {key}: {e}")
+            return
+
+        if key in self.entries:
+            self.total_bytes -= self.entries.pop(key).size
+        self.entries[key] = entry
+        self.total_bytes += entry.size
+
+        while self.total_bytes > self.max_bytes and self.entries:
+            self._evict(next(iter(self.entries)))
+
+    def _evict(self, key: str) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+        self._remove_files(key, entry)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "size_mb": round(self.total_bytes / 1024 / 1024, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "saved_synthesis_seconds": round(self.saved_seconds, 1),
+        }
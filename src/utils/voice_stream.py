@@ -0,0 +1,181 @@
+import discord
+from decouple import config
+from scipy.signal import resample_poly
+
+import re
+import math
+import time
+import asyncio
+import logging
+import threading
+import numpy as np
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utils.audio_utils import SAMPLE_RATE
+
+DISCORD_SAMPLE_RATE = 48000
+FRAME_BYTES = 3840  # 20ms of 48kHz 16-bit stereo PCM
+SILENCE_FRAME = b"\x00" * FRAME_BYTES
+
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+def split_sentences(text: str, min_chars: int = 24) -> List[str]:
+    sentences = []
+    pending = ""
+    for part in SENTENCE_END.split(text):
+        part = part.strip()
+        if not part:
+            continue
+        pending = f"{pending} {part}".strip()
+        # Very short fragments ("Hm.", "Yes!") are merged into the next
+        # sentence so each synthesis call is worth its fixed overhead, except
+        # for the first one, which should reach the speaker as soon as possible.
+        if len(pending) >= min_chars or not sentences:
+            sentences.append(pending)
+            pending = ""
+    if pending:
+        sentences.append(pending)
+    return sentences
+
+def to_discord_pcm(audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> bytes:
+    audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+    gcd = math.gcd(DISCORD_SAMPLE_RATE, sample_rate)
+    audio = resample_poly(audio, DISCORD_SAMPLE_RATE // gcd, sample_rate // gcd)
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+    return np.repeat(pcm[:, None], 2, axis=1).tobytes()
+
+class StreamingTTSSource(discord.AudioSource):
+    """PCM source that is fed sentence by sentence while it is already playing."""
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._finished = False
+
+    def feed(self, pcm: bytes) -> None:
+        with self._lock:
+            self._buffer.extend(pcm)
+
+    def finish(self) -> None:
+        with self._lock:
+            self._finished = True
+
+    def read(self) -> bytes:
+        with self._lock:
+            if len(self._buffer) >= FRAME_BYTES:
+                frame = bytes(self._buffer[:FRAME_BYTES])
+                del self._buffer[:FRAME_BYTES]
+                return frame
+            if self._finished:
+                if not self._buffer:
+                    return b""
+                frame = bytes(self._buffer).ljust(FRAME_BYTES, b"\x00")
+                self._buffer.clear()
+                return frame
+        # The next sentence is still being synthesized. Blocking here would
+        # make the player thread burst frames to catch up afterwards, so play
+        # silence instead.
+        return SILENCE_FRAME
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self) -> None:
+        self.finish()
+
+class VoiceStreamer:
+    """Speaks text in a voice channel while the rest of it is still being synthesized.
+
+    `synthesize` turns one sentence into float audio at `SAMPLE_RATE`. The voice
+    client only needs `play(source, after=...)`, `is_playing()` and `stop()`.
+    Utterances for the same voice client play one after another: the next one
+    is synthesized while the previous one plays and starts when it ends.
+    """
+
+    def __init__(self, synthesize: Callable[[str], Awaitable[np.ndarray]]) -> None:
+        self.synthesize = synthesize
+        self.enabled = config("VOICE_STREAMING", default=False, cast=bool)
+        self.logger = logging.getLogger(__name__)
+        # The last utterance queued on each voice client, done when it has
+        # finished playing.
+        self._playing: Dict[int, asyncio.Future] = {}
+
+        self.utterances = 0
+        self.total_first_audio = 0.0
+        self.max_first_audio = 0.0
+
+    async def connect(self, channel: discord.VoiceChannel) -> discord.VoiceClient:
+        voice_client = channel.guild.voice_client
+        if voice_client is None or not voice_client.is_connected():
+            return await channel.connect()
+        if voice_client.channel != channel:
+            await voice_client.move_to(channel)
+        return voice_client
+
+    async def speak(self, voice_client: Any, text: str) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+
+        key = id(voice_client)
+        previous = self._playing.get(key)
+        self._playing[key] = done
+        done.add_done_callback(lambda f: self._playing.get(key) is f and self._playing.pop(key))
+
+        def after(error: Optional[Exception]) -> None:
+            if error:
+                self.logger.error(f"Voice playback failed: {error}")
+            loop.call_soon_threadsafe(lambda: done.done() or done.set_result(error))
+
+        async def play() -> None:
+            # Never cut off the previous utterance; the rest of this one keeps
+            # being synthesized into the source meanwhile.
+            if previous is not None:
+                await previous
+            try:
+                if voice_client.is_playing():
+                    # Something we didn't queue, e.g. from before a reload.
+                    voice_client.stop()
+                voice_client.play(source, after=after)
+            except Exception as e:
+                self.logger.error(f"Voice playback failed: {e}")
+                if not done.done():
+                    done.set_result(e)
+
+        source = StreamingTTSSource()
+        start = time.perf_counter()
+        player: Optional[asyncio.Task] = None
+        try:
+            for sentence in split_sentences(text):
+                audio = await self.synthesize(sentence)
+                if audio is None:
+                    continue
+                source.feed(await asyncio.to_thread(to_discord_pcm, audio))
+
+                if player is None:
+                    player = asyncio.create_task(play())
+                    self._record_first_audio(time.perf_counter() - start)
+        finally:
+            source.finish()
+            if player is None:
+                # Nothing to play, but whatever was queued before still has
+                # to finish before the next utterance starts.
+                if previous is None:
+                    done.set_result(None)
+                else:
+                    previous.add_done_callback(lambda f: done.done() or done.set_result(None))
+
+        return done
+
+    def _record_first_audio(self, seconds: float) -> None:
+        self.utterances += 1
+        self.total_first_audio += seconds
+        self.max_first_audio = max(self.max_first_audio, seconds)
+        self.logger.info(f"First sentence ready to play after {seconds * 1000:.0f}ms")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "utterances": self.utterances,
+            "avg_first_audio_ms": round(self.total_first_audio / self.utterances * 1000) if self.utterances else 0,
+            "max_first_audio_ms": round(self.max_first_audio * 1000),
+        }
@@ -1,12 +1,16 @@
 from txtai.pipeline import TextToSpeech
 
 import torch
+import asyncio
 from typing import Tuple
+from decouple import config
 
 class VoiceUtils:
     def __init__(self) -> None:
-        self.tts = TextToSpeech("NeuML/kokoro-fp16-onnx")
+        self.model = config("TTS_MODEL", default="NeuML/kokoro-fp16-onnx")
+        self.speaker = config("TTS_SPEAKER", default="af_bella")
+        self.tts = TextToSpeech(self.model)
 
     async def generate_voice(self, text: str) -> Tuple[torch.Tensor, str]:
-        audio, out_ps = self.tts(text, speaker="af_bella")
+        audio, out_ps = await asyncio.to_thread(self.tts, text, speaker=self.speaker)
         return audio, out_ps
\ No newline at end of file
@@ -0,0 +1,75 @@
+"""Run with `python -m unittest discover tests` from the repository root."""
+import sys
+import asyncio
+import threading
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from utils.audio_utils import SAMPLE_RATE
+from utils.voice_stream import SILENCE_FRAME, VoiceStreamer, to_discord_pcm
+
+class FakeVoiceClient:
+    """Plays sources on a thread like discord.py's player, recording every frame."""
+
+    def __init__(self) -> None:
+        self.played = []
+        self.stopped = 0
+        self._player = None
+        self._stop = threading.Event()
+
+    def is_playing(self) -> bool:
+        return self._player is not None and self._player.is_alive()
+
+    def stop(self) -> None:
+        self.stopped += 1
+        self._stop.set()
+        self._player.join()
+
+    def play(self, source, after=None) -> None:
+        if self.is_playing():
+            raise RuntimeError("Already playing audio.")
+        frames = bytearray()
+        self.played.append(frames)
+        self._stop = threading.Event()
+
+        def run() -> None:
+            while not self._stop.is_set():
+                frame = source.read()
+                if not frame:
+                    break
+                if frame != SILENCE_FRAME:
+                    frames.extend(frame)
+                self._stop.wait(0.001)
+            if after is not None:
+                after(None)
+
+        self._player = threading.Thread(target=run, daemon=True)
+        self._player.start()
+
+def tone(seconds: float) -> np.ndarray:
+    return np.full(int(SAMPLE_RATE * seconds), 0.5, dtype=np.float32)
+
+class VoiceStreamerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_consecutive_utterances_play_in_full(self) -> None:
+        async def synthesize(sentence: str) -> np.ndarray:
+            await asyncio.sleep(0.01)
+            return tone(0.2)
+
+        streamer = VoiceStreamer(synthesize)
+        voice_client = FakeVoiceClient()
+        text = "This is the first sentence of it. And here is the second one."
+
+        first = await streamer.speak(voice_client, text)
+        second = await streamer.speak(voice_client, text)
+        await asyncio.wait_for(asyncio.gather(first, second), timeout=10)
+
+        expected = 2 * len(to_discord_pcm(tone(0.2)))
+        self.assertEqual(voice_client.stopped, 0)
+        self.assertEqual([len(frames) for frames in voice_client.played], [expected, expected])
+
+if __name__ == "__main__":
+    unittest.main()